@@ -0,0 +1,66 @@
+"""
+Benchmark parsing a parkrunner /all results page: pd.read_html + regex scans vs parse_athlete_page.
+
+Run from the repo root:
+    python -m benchmarks.bench_athlete_page [n_runs]
+"""
+import io
+import re
+import sys
+import timeit
+
+import pandas as pd
+
+from parkrun.parsing import parse_athlete_page
+
+
+def make_athlete_page(n_runs=600) -> bytes:
+    """Synthetic athlete page shaped like parkrun's, with n_runs rows in the all results table"""
+    events = ["The Ponds", "Parramatta", "Rhodes", "Curl Curl", "St Peters"]
+    rows = "".join(
+        f"<tr><td><a href='#'>{events[i % len(events)]}</a></td>"
+        f"<td><span class='format-date'>{(i % 28) + 1:02d}/{(i % 12) + 1:02d}/{2010 + i // 52}</span></td>"
+        f"<td>{i + 1}</td><td>{(i * 7) % 300 + 1}</td><td>{20 + i % 10}:{i % 60:02d}</td>"
+        f"<td>{50 + i % 30}.{i % 100:02d}%</td><td>{'PB' if i % 17 == 0 else ''}</td></tr>"
+        for i in range(n_runs)
+    )
+    return f"""<html><head><title>results | parkrun Australia</title></head><body>
+<h2>John DOE\xa0<span style="font-weight: normal;" title="parkrun ID">(A7417035)</span></h2>
+<h3>
+{n_runs} parkruns total</h3>
+<p>Most recent age category was SM30-34
+</p>
+<table><caption>Summary Stats for All Locations</caption>
+<thead><tr><th></th><th>Time</th><th>Age Grading</th><th>Overall Position</th></tr></thead>
+<tbody><tr><td>Fastest</td><td>17:05</td><td>70.12%</td><td>1</td></tr>
+<tr><td>Average</td><td>21:30</td><td>60.01%</td><td>80</td></tr>
+<tr><td>Slowest</td><td>29:59</td><td>45.00%</td><td>300</td></tr></tbody></table>
+<table><caption>Best Overall Annual Achievements</caption>
+<thead><tr><th>Year</th><th>Best Time</th><th>Best Age Grading</th></tr></thead>
+<tbody><tr><td>2023</td><td>17:05</td><td>70.12%</td></tr></tbody></table>
+<table><caption>All Results</caption>
+<thead><tr><th>Event</th><th>Run Date</th><th>Run Number</th><th>Pos</th><th>Time</th><th>Age Grade</th><th>PB?</th></tr></thead>
+<tbody>{rows}</tbody></table>
+</body></html>""".encode("utf-8")
+
+
+def parse_read_html(content: bytes):
+    """Previous path - read_html builds every table, then three regex scans over the decoded text"""
+    text = content.decode("utf-8")
+    tables = pd.read_html(io.StringIO(text))[:3]
+    other_info = {
+        "athlete_name": re.search("<h2>(.*)\xa0<span", text).group(1).strip(),
+        "nbr_parkruns": re.search("<h3>\n(.*)parkruns total", text).group(1).strip(),
+        "last_age_category": re.search("Most recent age category was (.*)\n", text).group(1).strip(),
+    }
+    return tables, other_info
+
+
+if __name__ == "__main__":
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    content = make_athlete_page(n_runs)
+    n = 20
+
+    for label, func in [("read_html + regex", parse_read_html), ("parse_athlete_page", parse_athlete_page)]:
+        seconds = min(timeit.repeat(lambda: func(content), number=n, repeat=3)) / n
+        print(f"{label:<20} {n_runs} runs: {seconds * 1000:.1f} ms/page")
@@ -0,0 +1,46 @@
+"""
+Benchmark the Serverside payload per profile: pickling the full Parkrunner (raw response and
+both results tables) vs the compact ParkrunnerResult format.
+
+Run from the repo root:
+    python -m benchmarks.bench_result_bundle [n_runs]
+"""
+import pickle
+import sys
+import timeit
+
+import requests
+
+from benchmarks.bench_athlete_page import make_athlete_page
+from parkrun.Parkrunner import Parkrunner
+from parkrun.parsing import parse_athlete_page
+
+
+def make_parkrunner(n_runs=600) -> Parkrunner:
+    content = make_athlete_page(n_runs)
+    raw_scraped = requests.Response()
+    raw_scraped.status_code = 200
+    raw_scraped._content = content
+    raw_scraped.encoding = "utf-8"
+
+    page = parse_athlete_page(content)
+    parkrunner = Parkrunner(7417035)
+    parkrunner.raw_scraped = raw_scraped
+    parkrunner.tables = parkrunner.collect_tables(page["tables"])
+    parkrunner.other_info = page["other_info"]
+    return parkrunner
+
+
+if __name__ == "__main__":
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    parkrunner = make_parkrunner(n_runs)
+    n = 20
+
+    payloads = {
+        # previous behaviour - pickle every attribute of the object
+        "full object pickle": pickle.dumps(parkrunner.__dict__),
+        "ParkrunnerResult": pickle.dumps(parkrunner),
+    }
+    for label, payload in payloads.items():
+        seconds = min(timeit.repeat(lambda: pickle.loads(payload), number=n, repeat=3)) / n
+        print(f"{label:<20} {n_runs} runs: {len(payload) / 1024:.1f} KB, {seconds * 1000:.1f} ms to load")
@@ -1,10 +1,25 @@
 from flask import Flask
 from flask.helpers import get_root_path
+from dash import DiskcacheManager
 from dash_extensions.enrich import DashProxy, ServersideOutputTransform
+import diskcache
 import os
 from os import getpid
 import dash_bootstrap_components as dbc
 
+from parkrun.constants import cache_dir
+from dash_app.serverside_cache import BoundedFileSystemBackend
+
+
+def background_callback_manager():
+    """
+    Local job manager for background callbacks - jobs run in worker processes, with their state and
+    results in an on-disk cache shared by all app processes, so no external broker is needed
+    """
+    cache = diskcache.Cache(os.path.join(cache_dir, "background-jobs"))
+    # results are collected by the polling browser straight away - don't keep them around for long
+    return DiskcacheManager(cache, expire=600)
+
 
 def create_app(dash_debug, dash_auto_reload):
     server = Flask(__name__, static_folder='static')
@@ -45,7 +60,10 @@ def register_dash_app(flask_server, title, base_pathname, layout, register_callb
         __name__,
         server=flask_server,
         suppress_callback_exceptions=True,
-        transforms=[ServersideOutputTransform()],
+        # bounded cache of Serverside outputs (parkrunner data per submitted ID)
+        transforms=[ServersideOutputTransform(backends=[BoundedFileSystemBackend()])],
+        # e.g. loading parkrunner profiles - off the request thread, with progress and cancellation
+        background_callback_manager=background_callback_manager(),
         assets_folder=assets_folder,
         external_stylesheets=[
             dbc.themes.BOOTSTRAP,
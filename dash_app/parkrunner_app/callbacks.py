@@ -10,8 +10,11 @@ import dash_leaflet.express as dlx
 from dash_extensions.javascript import assign, Namespace
 
 from parkrun.Parkrunner import Parkrunner
-from parkrun.load_data import get_parkrun_locations
+from parkrun.events_catalogue import events_catalogue
+from parkrun.parsing import format_seconds
+from parkrun.export import export_results, export_filename
 
+from dash_app.parkrunner_app.table_query import query_table
 from dash_app.parkrunner_app.global_scheme import parkrun_purple, parkrun_purple_lighter
 
 def register_callbacks(app):
@@ -21,19 +24,40 @@ def register_callbacks(app):
     from dash_extensions.enrich import callback
 
     #################################   Load data   #################################
+    # (progress bar value, label) for each stage of loading a profile
+    load_stages = {
+        "fetching": (20, "Fetching profile..."),
+        "parsing": (60, "Parsing results..."),
+        "rendering": (90, "Rendering..."),
+    }
+
     @callback(
         Output("store-parkrunner", "data"),
         Output("alert-wrong-id","children"),
         Input('input-ok-athlete-id', 'n_clicks'),
         State('input-athlete-id', 'value'),
+        # runs as a background job (see background_callback_manager in dash_app), off the request thread.
+        # Submitting again while a load is running cancels the running job, as does the cancel button.
+        background=True,
+        progress=[Output("progress-load-parkrunner", "value"), Output("progress-load-parkrunner", "label")],
+        running=[
+            (Output("progress-load-parkrunner", "style"), {"width": "400px"}, {"width": "400px", "display": "none"}),
+            (Output("cancel-load-athlete-id", "style"),
+             {"width": "100px", "margin-left": "10px"},
+             {"width": "100px", "margin-left": "10px", "display": "none"}),
+        ],
+        cancel=[Input("cancel-load-athlete-id", "n_clicks")],
         prevent_initial_call=True
     )
-    def update_parkrunner(n_clicks, athlete_id):
+    def update_parkrunner(set_progress, n_clicks, athlete_id):
         """Load parkrunner data"""
         if n_clicks:
             try:
-                parkrunner = Parkrunner(athlete_id)
-                parkrunner.fetch_data()
+                # coalesced with any concurrent load of the same athlete, in any worker
+                parkrunner = Parkrunner.load_profile(
+                    athlete_id, progress=lambda stage: set_progress(load_stages[stage])
+                )
+                set_progress(load_stages["rendering"])
                 error_alert = ""
             except:
                 parkrunner = None
@@ -87,7 +111,7 @@ def register_callbacks(app):
 
         name = f'Parkrunner: {info["athlete_name"]}'
         age_category = f'Last updated age category: {info["last_age_category"]}'
-        nbr_parkruns = f'Parkrun attendances: {info["nbr_parkruns"]} parkruns @ {all_results_dld.Event.nunique()} locations'
+        nbr_parkruns = f'Parkrun attendances: {info["nbr_parkruns"]} parkruns @ {len(parkrunner.event_stats)} locations'
 
         summary_stats = (
             summary_stats
@@ -110,11 +134,15 @@ def register_callbacks(app):
         ])
 
         recent_parkruns = all_results_dld
+        # only the first page is sent - paging, sorting and filtering happen server-side
+        first_page, page_count = query_table(
+            recent_parkruns, page_current=0, page_size=10, cache_key=(parkrunner.athlete_id, parkrunner.data_version)
+        )
         tbl_recent_parkruns = html.Div([
             html.H6("All parkrun results"),
             dash_table.DataTable(
-                # to json
-                data=recent_parkruns.to_dict('records'),
+                id="tbl-parkrun-results",
+                data=first_page,
                 columns=[{"name": i, "id": i} for i in recent_parkruns.columns],
                 tooltip_header={
                     "Parkrun Number": ["Index number for count of parkruns completed, for this parkrunner"],
@@ -125,11 +153,15 @@ def register_callbacks(app):
                 },
 
                 # user interactivity
-                filter_action="native",
-                sort_action="native",
+                filter_action="custom",
+                filter_query="",
+                sort_action="custom",
                 sort_mode="multi",
+                sort_by=[],
+                page_action="custom",
                 page_current=0,
                 page_size=10,
+                page_count=page_count,
                 # export_format='csv',
 
                 # formatting
@@ -149,7 +181,24 @@ def register_callbacks(app):
                 style_cell={'font-family': "Segoe UI"}
             ),
 
-            html.Button("Download as CSV", id="dld-btn-parkrun-results"),
+            html.Div([
+                html.Div(
+                    dcc.Dropdown(
+                        options=[
+                            {"label": "CSV", "value": "csv"},
+                            {"label": "CSV (gzip)", "value": "csv.gz"},
+                            {"label": "Parquet", "value": "parquet"},
+                            {"label": "JSON Lines", "value": "jsonl"},
+                        ],
+                        value="csv",
+                        id="dld-format-parkrun-results",
+                        clearable=False,
+                        style={"width": "150px"}
+                    ),
+                    style={"display": "inline-block", "vertical-align": "middle"}
+                ),
+                html.Button("Download", id="dld-btn-parkrun-results", style={"margin-left": "10px"}),
+            ]),
             dcc.Download(id="download-results-csv")
         ])
 
@@ -158,17 +207,45 @@ def register_callbacks(app):
                 tbl_summary_stats, tbl_recent_parkruns
 
 
+    # SUMMARY TAB: Page / sort / filter parkrun results server-side
+    @callback(
+        Output('tbl-parkrun-results', 'data'),
+        Output('tbl-parkrun-results', 'page_count'),
+        Input('tbl-parkrun-results', 'page_current'),
+        Input('tbl-parkrun-results', 'page_size'),
+        Input('tbl-parkrun-results', 'sort_by'),
+        Input('tbl-parkrun-results', 'filter_query'),
+        State('store-parkrunner', 'data'),
+        prevent_initial_call=True
+    )
+    def update_tbl_parkrun_results(page_current, page_size, sort_by, filter_query, parkrunner):
+        if not parkrunner:
+            return [], 1
+        # the download table is only built on a cache miss - data_version doesn't need it
+        df = lambda: parkrunner.tables['all_results_dld']
+        cache_key = (parkrunner.athlete_id, parkrunner.data_version)
+        try:
+            return query_table(df, page_current, page_size, sort_by, filter_query, cache_key=cache_key)
+        except ValueError:
+            # incomplete / invalid filter query - show the results unfiltered
+            return query_table(df, page_current, page_size, sort_by, cache_key=cache_key)
+
+
     # SUMMARY TAB: Download parkrun results
     @callback(
         Output('download-results-csv', 'data'),
         Input('dld-btn-parkrun-results', 'n_clicks'),
+        State('dld-format-parkrun-results', 'value'),
         State('store-parkrunner', 'data'),
         prevent_initial_call=True
     )
-    def download_tbl_parkrun_results(n_clicks, parkrunner):
+    def download_tbl_parkrun_results(n_clicks, fmt, parkrunner):
         if n_clicks and parkrunner:
-            df = parkrunner.tables['all_results_dld']
-            return dcc.send_data_frame(df.to_csv, f"results-{parkrunner.athlete_id}.csv", index=False)
+            # encoded bytes are cached per athlete data version and format
+            return dcc.send_bytes(
+                export_results(parkrunner, fmt=fmt),
+                export_filename(parkrunner.athlete_id, fmt=fmt)
+            )
         
 
     #################################   Finishing times plot tab   #################################
@@ -179,7 +256,7 @@ def register_callbacks(app):
         prevent_initial_call=True
     )
     def render_parkrunner_results_plot(parkrunner):
-        return parkrunner.plot_finishing_times()
+        return parkrunner.cached_figure("plot_finishing_times")
 
 
     #################################   Locations box plot tab   #################################
@@ -191,9 +268,9 @@ def register_callbacks(app):
     )
     def render_parkrunner_locations_boxplot(by, parkrunner):
         if by == "Most attendances":
-            return parkrunner.plot_boxplot_times_by_event(order_by="events")
+            return parkrunner.cached_figure("plot_boxplot_times_by_event", order_by="events")
         else:
-            return parkrunner.plot_boxplot_times_by_event(order_by="time")
+            return parkrunner.cached_figure("plot_boxplot_times_by_event", order_by="time")
                 
 
     #################################   Map tab  #################################
@@ -205,37 +282,27 @@ def register_callbacks(app):
     )
     def render_parkrunner_map(parkrunner):
 
-        # Get parkrun locations json and convert to geojson
-        features = get_parkrun_locations()
-
-        all_results = parkrunner.tables["all_results"]
-
-        search_for = all_results.Event.unique()
-        keep_locations = []
-        for x in features:
-            if x["properties"]["EventShortName"] in search_for:
-
-                event = x["properties"]["EventShortName"]
-                df = all_results
-                df = df[df.Event == event]
+        # Look up attended events in the (cached, indexed) parkrun events catalogue
+        catalogue = events_catalogue.get()
 
-                last_attendance = str(df['Run Date'].max().date())
-                attendances = len(df)
-                fastest_time = str(df.Time_datetime.min())
+        event_stats = parkrunner.event_stats
 
-                add_text = f"Most recent attendance: {last_attendance}<br>Total attendances: {attendances}<br>Fastest time: {fastest_time} "
-                x['add_text'] = add_text
+        keep_locations = catalogue.lookup(event_stats.index)
+        dicts = []
+        for location in keep_locations:
+            stats = event_stats.loc[location.short_name]
 
-                keep_locations.append(x)
+            last_attendance = str(stats.last_date.date())
+            attendances = stats.n_runs
+            fastest_time = format_seconds(stats.pb_seconds)
 
-        dicts = [
-            {
-                "tooltip": f"{m['properties']['EventLongName']}<br> {m['add_text']}",
-                "popup": f"{m['properties']['EventLongName']}<br> {m['add_text']}",
-                "lat": m['geometry']['coordinates'][1],
-                "lon": m['geometry']['coordinates'][0]
-            } for m in keep_locations
-        ]
+            add_text = f"Most recent attendance: {last_attendance}<br>Total attendances: {attendances}<br>Fastest time: {fastest_time} "
+            dicts.append({
+                "tooltip": f"{location.long_name}<br> {add_text}",
+                "popup": f"{location.long_name}<br> {add_text}",
+                "lat": location.lat,
+                "lon": location.lon
+            })
 
         ns = Namespace('dashExtensions','dashExtensionssub')
         dl_cluster = dl.GeoJSON(
@@ -247,8 +314,7 @@ def register_callbacks(app):
         )
 
         # Centre coordinates
-        centre_coords = keep_locations[0]['geometry']['coordinates']
-        centre_coords.reverse()
+        centre_coords = [keep_locations[0].lat, keep_locations[0].lon]
 
         return dl.Map(
                             center=centre_coords, 
@@ -269,4 +335,4 @@ def register_callbacks(app):
         prevent_initial_call=True
     )
     def render_parkrunner_attendance_heatmap(parkrunner):
-        return parkrunner.plot_heatmap_mthly_attendance()
\ No newline at end of file
+        return parkrunner.cached_figure("plot_heatmap_mthly_attendance")
\ No newline at end of file
@@ -49,8 +49,16 @@ layout = html.Div([
                                 placeholder="Athlete ID e.g. 7417035",
                                 style={"width": "400px"}),
                         html.P(""),
-                        html.Button('Submit', id='input-ok-athlete-id', n_clicks=0,
-                                    style={"width": "100px"})
+                        html.Div([
+                            html.Button('Submit', id='input-ok-athlete-id', n_clicks=0,
+                                        style={"width": "100px"}),
+                            html.Button('Cancel', id='cancel-load-athlete-id', n_clicks=0,
+                                        style={"width": "100px", "margin-left": "10px", "display": "none"}),
+                        ]),
+                        html.P(""),
+                        # profile loading progress - shown while the background load is running
+                        dbc.Progress(id="progress-load-parkrunner", value=0, striped=True, animated=True,
+                                     style={"width": "400px", "display": "none"})
                     ], style={"width": "90%", "padding": "20px", 'min-height':'35vh'}
                     )
                 ], width=4),
@@ -0,0 +1,283 @@
+"""
+Server-side paging, sorting and filtering for DataTables with page/sort/filter_action="custom",
+including a parser for the DataTable filter query language, e.g.
+    {Event} icontains "ponds" && ({Position} < 50 || {Run Date} datestartswith 2023)
+"""
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from parkrun.parsing import time_to_seconds
+
+
+# typed keys ------------------------------------------
+def _age_grade_to_float(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values.astype("string").str.rstrip("%"), errors="coerce")
+
+
+# display columns that sort / compare on a typed key rather than their text
+TYPED_KEYS = {
+    "Run Date": lambda values: pd.to_datetime(values, errors="coerce"),
+    "Time": time_to_seconds,
+    "Age Grade": _age_grade_to_float,
+}
+
+
+def _typed_key(values: pd.Series) -> pd.Series:
+    convert = TYPED_KEYS.get(values.name)
+    if convert is not None:
+        return convert(values)
+    return values
+
+
+class _TypedFrames:
+    """
+    Small LRU of tables with their typed key frames, so paging through a table neither rebuilds
+    the table nor re-parses its columns
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, df, cache_key=None):
+        """
+        :param df: DataFrame, or a callable returning it - only called if cache_key isn't cached
+        :return: (df, typed keys)
+        """
+        if cache_key is not None:
+            with self._lock:
+                cached = self._frames.get(cache_key)
+                if cached is not None:
+                    self._frames.move_to_end(cache_key)
+                    return cached
+        if callable(df):
+            df = df()
+        cached = df, df.apply(_typed_key)
+        if cache_key is not None:
+            with self._lock:
+                self._frames[cache_key] = cached
+                while len(self._frames) > self.max_entries:
+                    self._frames.popitem(last=False)
+        return cached
+
+
+_typed_frames = _TypedFrames()
+
+
+# filter query parser ---------------------------------
+_TOKEN = re.compile(
+    r"""
+    \s*(?:
+        (?P<column>\{(?:[^{}\\]|\\.)*\})
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`(?:[^`\\]|\\.)*`)
+      | (?P<logical>&&|\|\||\band\b|\bor\b)
+      | (?P<paren>[()])
+      | (?P<unary>is\s+(?:blank|nil|num|str|bool|object))
+      | (?P<binary>[is]?(?:>=|<=|!=|=|<|>|(?:eq|ne|lt|le|gt|ge|contains|datestartswith)\b))
+      | (?P<not>!)
+      | (?P<value>[^\s()]+)
+    )""",
+    re.VERBOSE | re.IGNORECASE,
+)
+
+_BINARY_ALIASES = {"eq": "=", "ne": "!=", "lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+
+
+def _tokenize(query: str):
+    """:return: list of (kind, text, start, end) - start / end of the text in query"""
+    tokens, pos = [], 0
+    query = query.rstrip()
+    while pos < len(query):
+        match = _TOKEN.match(query, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Invalid filter query at position {pos}: {query[pos:]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind), match.end(kind)))
+        pos = match.end()
+    return tokens
+
+
+def _unquote(token):
+    kind, text = token[:2]
+    if kind in ("column", "string"):
+        return re.sub(r"\\(.)", r"\1", text[1:-1])
+    return text
+
+
+class _FilterParser:
+    """
+    Recursive descent over the tokens, evaluating to a boolean mask over the frame:
+        expr    := and_expr ( '||' and_expr )*
+        and_expr:= unary ( '&&' unary )*
+        unary   := '!' unary | '(' expr ')' | comparison
+    A comparison's value runs up to the next '&&' / '||' / parenthesis, so unquoted values can
+    have spaces, e.g. {Event} contains Curl Curl
+    """
+
+    def __init__(self, df: pd.DataFrame, keys: pd.DataFrame, query: str):
+        self.df = df
+        self.keys = keys
+        self.query = query
+        self.tokens = _tokenize(query)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None, None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ValueError("Unexpected end of filter query")
+        self.pos += 1
+        return token
+
+    def parse(self) -> np.ndarray:
+        if not self.tokens:
+            return np.ones(len(self.df), dtype=bool)
+        mask = self._expr()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self._peek()[1]!r} in filter query")
+        return mask
+
+    def _expr(self):
+        mask = self._and_expr()
+        while self._peek()[0] == "logical" and self._peek()[1].lower() in ("||", "or"):
+            self._next()
+            mask = mask | self._and_expr()
+        return mask
+
+    def _and_expr(self):
+        mask = self._unary()
+        while self._peek()[0] == "logical" and self._peek()[1].lower() in ("&&", "and"):
+            self._next()
+            mask = mask & self._unary()
+        return mask
+
+    def _unary(self):
+        kind, text = self._peek()[:2]
+        if kind == "not":
+            self._next()
+            return ~self._unary()
+        if kind == "paren" and text == "(":
+            self._next()
+            mask = self._expr()
+            if self._next()[:2] != ("paren", ")"):
+                raise ValueError("Unbalanced parentheses in filter query")
+            return mask
+        return self._comparison()
+
+    def _comparison(self):
+        column_token = self._next()
+        if column_token[0] != "column":
+            raise ValueError(f"Expected a {{column}} in filter query, got {column_token[1]!r}")
+        column = _unquote(column_token)
+        if column not in self.df.columns:
+            raise ValueError(f"Unknown column {column!r} in filter query")
+
+        kind, operator = self._next()[:2]
+        if kind == "unary":
+            return self._unary_op(column, operator.split()[-1].lower())
+        if kind != "binary":
+            raise ValueError(f"Expected an operator after {{{column}}}, got {operator!r}")
+
+        value_tokens = [self._next()]
+        if value_tokens[0][0] not in ("string", "value"):
+            raise ValueError(f"Expected a value after {operator!r}, got {value_tokens[0][1]!r}")
+        while self._peek()[0] in ("string", "value"):
+            value_tokens.append(self._next())
+        if len(value_tokens) == 1:
+            value = _unquote(value_tokens[0])
+        else:
+            # unquoted words - the value is the query text they span, spacing included
+            value = self.query[value_tokens[0][2]:value_tokens[-1][3]]
+        return self._binary_op(column, operator.lower(), value)
+
+    def _unary_op(self, column, operator) -> np.ndarray:
+        values = self.df[column]
+        if operator in ("blank", "nil"):
+            blank = values.isna()
+            if operator == "blank":
+                blank |= values.astype("string").str.strip().eq("").fillna(False)
+            return blank.to_numpy(dtype=bool)
+        if operator == "num":
+            return pd.to_numeric(values, errors="coerce").notna().to_numpy(dtype=bool)
+        if operator == "bool":
+            return values.map(lambda v: isinstance(v, (bool, np.bool_))).to_numpy(dtype=bool)
+        # str / object
+        return values.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+
+    def _binary_op(self, column, operator, value) -> np.ndarray:
+        case_insensitive = operator[0] == "i"
+        if operator[0] in "is":
+            operator = operator[1:]
+        operator = _BINARY_ALIASES.get(operator, operator)
+
+        if operator in ("contains", "datestartswith"):
+            text = self.df[column].astype("string")
+            if case_insensitive:
+                text, value = text.str.lower(), value.lower()
+            if operator == "contains":
+                matches = text.str.contains(value, regex=False)
+            else:
+                matches = text.str.startswith(value)
+            return matches.fillna(False).to_numpy(dtype=bool)
+
+        # comparisons - on the column's typed key, with the value parsed the same way
+        keys = self.keys[column]
+        typed_value = _typed_key(pd.Series([value], name=column)).iloc[0]
+        if keys.dtype.kind in "iuf" or pd.api.types.is_numeric_dtype(keys):
+            typed_value = pd.to_numeric(typed_value, errors="coerce")
+        if pd.isna(typed_value):
+            # value can't be compared with this column - only (in)equality of the text can match
+            text = self.df[column].astype("string")
+            matches = text.eq(value) if operator == "=" else text.ne(value) if operator == "!=" else None
+            if matches is None:
+                return np.zeros(len(self.df), dtype=bool)
+            return matches.fillna(operator == "!=").to_numpy(dtype=bool)
+
+        if case_insensitive and isinstance(typed_value, str):
+            keys, typed_value = keys.astype("string").str.lower(), typed_value.lower()
+        compare = {
+            "=": keys.eq, "!=": keys.ne, "<": keys.lt, "<=": keys.le, ">": keys.gt, ">=": keys.ge,
+        }[operator]
+        return compare(typed_value).fillna(False).to_numpy(dtype=bool)
+
+
+# paging ----------------------------------------------
+def query_table(df, page_current=0, page_size=10, sort_by=None, filter_query="", cache_key=None):
+    """
+    Filter, sort and page df as a DataTable with page/sort/filter_action="custom" would
+    :param df: DataFrame, or a callable returning it - with a cache_key, only called on a cache miss
+    :param sort_by: DataTable sort_by - list of {"column_id": ..., "direction": "asc" | "desc"}
+    :param cache_key: identifies df's contents (e.g. athlete id + data version) - df and its typed
+                      sort keys are cached under it across calls
+    :return: (records for the current page, page count)
+    """
+    df, keys = _typed_frames.get(df, cache_key)
+    positions = np.flatnonzero(_FilterParser(df, keys, filter_query or "").parse())
+
+    sort_by = [s for s in (sort_by or []) if s["column_id"] in df.columns]
+    if sort_by:
+        order = (
+            keys.iloc[positions]
+            .reset_index(drop=True)
+            .sort_values(
+                [s["column_id"] for s in sort_by],
+                ascending=[s["direction"] == "asc" for s in sort_by],
+                kind="stable",
+                na_position="last",
+            )
+            .index.to_numpy()
+        )
+        positions = positions[order]
+
+    page_count = max(1, math.ceil(len(positions) / page_size))
+    page = positions[page_current * page_size:(page_current + 1) * page_size]
+    records = df.iloc[page].to_dict("records")
+    return records, page_count
@@ -0,0 +1,154 @@
+"""Bounded file system backend for dash-extensions Serverside outputs"""
+import contextlib
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from dash_extensions.enrich import ServersideBackend
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows - fall back to in-process locking only
+    fcntl = None
+
+from parkrun.constants import cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedFileSystemBackend(ServersideBackend):
+    """
+    Serverside backend that keeps its cache directory bounded.
+
+    - entries are pickles, written to a temp file and renamed into place
+    - reads bump the entry's mtime, which is used as its last-access time
+    - after each write, entries idle for longer than `ttl` are expired, then least recently
+      used entries are evicted until there are at most `max_entries` using at most `max_bytes`
+    - eviction holds an exclusive lock file, so it is safe across gunicorn worker processes
+
+    Hit / miss / eviction counters are kept per process - see stats().
+    """
+
+    def __init__(self, cache_dir=os.path.join(cache_dir, "serverside"), max_bytes=512 * 1024**2,
+                 max_entries=2000, ttl=24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock_path = os.path.join(self.cache_dir, ".lock")
+        self._thread_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expirations": 0}
+
+    @property
+    def uid(self) -> str:
+        return f"{self.__class__.__name__}:{self.cache_dir}"
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(str(key).encode()).hexdigest() + ".pkl")
+
+    def _count(self, counter, n=1):
+        with self._thread_lock:
+            self._counters[counter] += n
+
+    # ServersideBackend interface ----
+    def get(self, key, ignore_expired=False):
+        if key is None:
+            return None
+        filename = self._filename(key)
+        try:
+            if not ignore_expired and time.time() - os.path.getmtime(filename) > self.ttl:
+                self._count("misses")
+                return None
+            with open(filename, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError):
+            logger.warning("Unreadable Serverside cache entry '%s'", filename, exc_info=True)
+            self._count("misses")
+            return None
+
+        with contextlib.suppress(OSError):
+            os.utime(filename)  # last access, for LRU
+        self._count("hits")
+        return value
+
+    def set(self, key, value):
+        filename = self._filename(key)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, filename)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+        self._count("writes")
+        self.evict()
+
+    def has(self, key):
+        return os.path.exists(self._filename(key))
+
+    # eviction ----
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Held while evicting - a lock file across processes, and a thread lock within this one"""
+        with self._evict_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self):
+        """Expire idle entries, then evict least recently used entries down to the bounds"""
+        with self._exclusive():
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".pkl"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            # oldest access first
+            entries.sort()
+            n_entries = len(entries)
+            n_bytes = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                expired = now - mtime > self.ttl
+                if not expired and n_entries <= self.max_entries and n_bytes <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+                n_entries -= 1
+                n_bytes -= size
+                self._count("expirations" if expired else "evictions")
+
+    def stats(self) -> dict:
+        """Counters for this process, plus the current size of the (shared) cache directory"""
+        with self._thread_lock:
+            stats = dict(self._counters)
+        sizes = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                with contextlib.suppress(FileNotFoundError):
+                    sizes.append(entry.stat().st_size)
+        stats.update(entries=len(sizes), bytes=sum(sizes))
+        return stats
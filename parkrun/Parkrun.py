@@ -1,158 +1,256 @@
 # libs -----------------------------------------------
+import io
+import logging
+import multiprocessing
+import os
 import requests
 import numpy as np
 import pandas as pd
 import re
-import matplotlib.pyplot as plt
-import seaborn as sns
+from functools import cached_property
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 from parkrun.constants import parkrun_url
 import parkrun.load_data as load_data
+from parkrun.parsing import time_to_seconds
+from parkrun.rate_limit import INTERACTIVE, BACKGROUND
+from parkrun.results_store import results_store
+
+logger = logging.getLogger(__name__)
+
+
+# precompiled patterns for results table cells
+_NAME = re.compile(r"^(\D+)")
+_N_PARKRUNS = re.compile(r"(\d+)\s+parkruns")
+_GENDER = re.compile(r"^(?P<gender>\D+?)\s*(?P<gender_position>\d+)\s*$")
+_AGE_GROUP = re.compile(
+    r"^(?P<full_age_group>[A-Z]{2}(?P<age_group>\d{3}-\d{3}|\d{2}-\d{2}|10))\s*(?:(?P<age_grade>\d+(?:\.\d+)?)%)?"
+)
+_TITLE = re.compile(r"<title>results \|(.*)parkrun</title>")
+# results page header, e.g. <span class="format-date">14/10/2023</span><span class="spacer">|</span><span>#462</span>
+_RUN_HEADER = re.compile(
+    r'class="format-date">\s*(?P<run_date>\d{1,2}/\d{1,2}/\d{4})\s*</span>.*?#(?P<run_number>\d+)', re.DOTALL
+)
+# columns of a results table, as read by pd.read_html
+_RAW_RESULTS_COLUMNS = ["Position", "parkrunner", "Gender", "Club", "Age Group", "Time"]
+_TIME = re.compile(
+    r"^(?P<finish_time>(?:\d{1,2}:)?\d{2}:\d{2})"
+    r"(?:PB(?P<pb>(?:\d{1,2}:)?\d{2}:\d{2}))?"
+)
 
 
 # class for parkrun event ----------------------------
 class Parkrun:
     """Scrapes data from parkrun results page and returns data and charts"""
 
-    def __init__(self, parkrun_url_name):
+    def __init__(self, parkrun_url_name, priority=INTERACTIVE):
+        """
+        Results are scraped and parsed lazily, on first access of raw_latest_results / latest_results /
+        event_name - for many events at once, see fetch_many()
+        :param priority: rate limiter lane for the scrape - INTERACTIVE or BACKGROUND
+        """
         # NOTE - this is really the name in the url, not the actual event name - e.g. 'theponds' not "The Ponds"
         self.event_url_name = parkrun_url_name
+        self.priority = priority
 
-        self.raw_latest_results = self.scrape_latest_results()
-        self.latest_results = self.collect_latest_results(
-            raw_results=self.raw_latest_results
-        )
+    @cached_property
+    def raw_latest_results(self) -> requests.Response:
+        return self.scrape_latest_results(priority=self.priority)
+
+    @cached_property
+    def latest_results(self) -> pd.DataFrame:
+        results = self.collect_latest_results(raw_results=self.raw_latest_results)
+        run_number, run_date = self.parse_run_header(self.raw_latest_results.text)
+        self.store_results(self.event_url_name, results, run_number, run_date)
+        return results
+
+    @cached_property
+    def event_name(self) -> str:
+        """Actual parkrun name, from the page title"""
+        return self.parse_event_name(self.raw_latest_results.text)
+
+    @staticmethod
+    def parse_event_name(html):
+        # title is in the page head - don't scan the whole page
+        end = html.find("</title>")
+        match = _TITLE.search(html, 0, end + len("</title>") if end >= 0 else len(html))
+        return match.group(1).strip() if match is not None else None
 
-        # Fetch actual parkrun name from raw
-        self.event_name = (
-            re.search(
-                "<title>results \|" + "(.*)" + "parkrun</title>",
-                self.raw_latest_results.text,
+    @classmethod
+    def fetch_many(cls, event_url_names, max_concurrency=16, parse_workers=None, priority=BACKGROUND):
+        """
+        Latest results of many events, e.g. a weekly snapshot of every event in a country.
+        Pages are fetched concurrently by threads (I/O bound, throttled by the shared rate limiter),
+        and each is handed to a process pool to parse as soon as it arrives (CPU bound).
+        :param event_url_names: iterable of event url names, e.g. ["theponds", "rhodes"]
+        :param max_concurrency: max pages fetched at once
+        :param parse_workers: parsing processes - None for one per CPU. With a single worker, pages are
+                              parsed in this process instead, as a pool would only add pickling overhead
+        :return: (one typed frame of all results with event, event_name, run_number and run_date columns,
+                  dict of event url name : exception for events that failed)
+        """
+        event_url_names = list(dict.fromkeys(event_url_names))
+        frames, failures = {}, {}
+        parse_workers = parse_workers or os.cpu_count() or 1
+        if parse_workers > 1:
+            # not fork - this process runs threads (fetches, Dash workers), whose held locks a fork would copy
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            parse_pool = ProcessPoolExecutor(
+                max_workers=parse_workers, mp_context=multiprocessing.get_context(start_method)
             )
-            .group(1)
-            .strip()
-        )
+        else:
+            parse_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="parkrun-parse")
 
-    # Data scraping / collecting ----
-    def scrape_latest_results(self):
-        latest_results_url = (
-            parkrun_url + self.event_url_name + "/results/latestresults/"
-        )
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="parkrun-fetch") as fetch_pool, \
+                parse_pool:
+            fetches = {
+                fetch_pool.submit(cls(name, priority=priority).scrape_latest_results, priority=priority): name
+                for name in event_url_names
+            }
+            parses = {}
+            for fetch in as_completed(fetches):
+                name = fetches[fetch]
+                try:
+                    raw_results = fetch.result()
+                    raw_results.raise_for_status()
+                except Exception as e:
+                    failures[name] = e
+                    continue
+                parses[parse_pool.submit(_parse_results_page, raw_results.text)] = name
+
+            for parse in as_completed(parses):
+                name = parses[parse]
+                try:
+                    frames[name] = frame = parse.result()
+                except Exception as e:
+                    failures[name] = e
+                    continue
+                if len(frame):
+                    cls.store_results(
+                        name,
+                        frame.drop(columns=["event_name", "run_number", "run_date"]),
+                        frame["run_number"].iloc[0],
+                        frame["run_date"].iloc[0],
+                    )
+
+        # concatenate in the order asked for - an empty frame of the same columns if every event failed
+        names = [name for name in event_url_names if name in frames]
+        if names:
+            results = pd.concat([frames[name] for name in names], ignore_index=True)
+        else:
+            results = _with_run_columns(Parkrun.parse_results_table(pd.DataFrame(columns=_RAW_RESULTS_COLUMNS)))
+        results.insert(0, "event", pd.Categorical(
+            np.repeat(names, [len(frames[name]) for name in names]), categories=names
+        ))
+        return results, failures
 
-        return load_data.scrape_url(latest_results_url)
-
-    def collect_latest_results(self, raw_results) -> pd.DataFrame:
-        results = pd.read_html(raw_results.text)[0]
-
-        # Helper functions - defined just for use in data prep
-        def get_text_before_first_number(s):
-            if not pd.isna(s):
-                match = re.search(r"^\D+", s)
-                if match:
-                    return match.group().strip()
-            return np.nan
-
-        def get_number_before_parkruns(s):
-            match = re.search(r"\d+\s+parkruns", s)
-            if match:
-                number_str = match.group().split()[0]
-                return int(number_str)
-            return 0
-
-        def get_age_group(s):
-            """Helper function to extract age group from last results"""
-            # handle na
-            if pd.isna(s):
-                return np.nan
-            elif "JM10" in s or "JW10" in s:
-                return s[:4]
-            else:
-                return s[:7]
-
-        def get_time(s):
-            """Helper function to get finish time"""
-            if pd.isna(s):
-                return np.nan
-            elif s[1] == ":":
-                # e.g. 1:12:56
-                return "59:59"
-            else:
-                return s[:5]
-
-        def get_pb(s):
-            """Helper function to extract PB from last results"""
-            # handle na
-            if pd.isna(s):
-                return np.nan
-            # new pb or first timer - take current time
-            elif "New PB!" in s or "First Timer" in s:
-                return get_time(s[:5])
-            # otherwise, take existing PB
-            else:
-                return get_time(s[-5:])
-
-        def convert_time(mm_ss):
-            """Helper function to convert mm:ss times to numeric"""
-            if pd.isna(mm_ss):
-                return np.nan
-            else:
-                return int(mm_ss.split(":")[0]) + int(mm_ss.split(":")[1]) / 60
-
-        # Clean raw data
-        results = (
-            results.assign(
-                # extract from results.parkrunner
-                # e.g. 'John DOE245 parkruns | Male  1  | Member of the 100 Club  SM25-29 | 77.63%  CLUB'
-                name=lambda x: x.parkrunner.apply(get_text_before_first_number),
-                n_parkruns=lambda x: x.parkrunner.apply(get_number_before_parkruns),
-                # extract from results.Gender
-                # e.g. Female  127
-                gender=lambda x: x.Gender.apply(get_text_before_first_number),
-                gender_position=lambda x: x.Gender.apply(
-                    lambda s: int(s.split()[-1]) if not pd.isna(s) else np.nan
-                ),
-                # extract from results['Age Group']
-                # e.g. SM25-2977.63% age grade
-                full_age_group=lambda x: x["Age Group"].apply(get_age_group),
-                age_group=lambda x: x.full_age_group.apply(
-                    lambda s: s[2:] if not pd.isna(s) else np.nan
-                ),
-                age_grade=lambda x: x["Age Group"].apply(
-                    lambda s: s[7:13] if not pd.isna(s) else np.nan
-                ),
-                # extract from results.Time
-                # e.g. 16:37PB15:58, 17:05New PB!
-                finish_time=lambda x: x.Time.apply(get_time),
-                curr_pb=lambda x: x.Time.apply(get_pb),
+    @staticmethod
+    def store_results(event_url_name, results, run_number, run_date):
+        """Persist one run's parsed results to the results store - skipped without pyarrow or a run date"""
+        if results_store is None or run_date is None or pd.isna(run_date):
+            return
+        try:
+            results_store.write_event_results(
+                event_url_name, run_date, results, run_number=None if pd.isna(run_number) else int(run_number)
             )
-            .rename(columns={"Position": "position", "Club": "club"})
-            .loc[
-                :,
-                [
-                    "position",
-                    "name",
-                    "n_parkruns",
-                    "gender",
-                    "gender_position",
-                    "club",
-                    "full_age_group",
-                    "age_group",
-                    "age_grade",
-                    "finish_time",
-                    "curr_pb",
-                ],
-            ]
-        )
+        except Exception:
+            # the store is a copy for cross-event queries - never fail a results lookup over it
+            logger.exception("Failed to store results for %s on %s", event_url_name, run_date)
+
+    # Data scraping / collecting ----
+    def scrape_latest_results(self, priority=INTERACTIVE):
+        return load_data.scrape_url(self.latest_results_url, priority=priority)
 
-        # Formatting
-        results["finish_time_numeric"] = results.finish_time.apply(convert_time)
-        results["curr_pb_numeric"] = results.curr_pb.apply(convert_time)
+    @property
+    def latest_results_url(self):
+        return parkrun_url + self.event_url_name + "/results/latestresults/"
 
-        return results
+    def scrape_results(self, run_number, priority=INTERACTIVE):
+        """Scrape the results page of one (past) run of this event - /results/{run_number}/"""
+        return load_data.scrape_url(self.results_url(run_number), priority=priority)
+
+    def results_url(self, run_number):
+        return parkrun_url + self.event_url_name + f"/results/{run_number}/"
+
+    @staticmethod
+    def collect_latest_results(raw_results) -> pd.DataFrame:
+        """Parse the results table of a scraped results page - latest or any past run"""
+        return Parkrun.parse_results_html(raw_results.text)
+
+    @staticmethod
+    def parse_results_html(html) -> pd.DataFrame:
+        # StringIO - newer pandas reads a literal string as a path
+        results = pd.read_html(io.StringIO(html), flavor="lxml")[0]
+        return Parkrun.parse_results_table(results)
+
+    @staticmethod
+    def parse_run_header(html):
+        """
+        :param html: results page text
+        :return: (run number, run date) of the run on a results page, or (None, None) if not found
+        """
+        match = _RUN_HEADER.search(html)
+        if match is None:
+            return None, None
+        return int(match["run_number"]), pd.to_datetime(match["run_date"], dayfirst=True)
+
+    @staticmethod
+    def parse_results_table(results) -> pd.DataFrame:
+        """
+        Vectorised clean of a raw results table (as read by pd.read_html) into typed columns
+        :param results: raw table with columns Position, parkrunner, Gender, Club, Age Group, Time
+        :return: One row per finisher
+        """
+        # extract from results.parkrunner
+        # e.g. 'John DOE245 parkruns | Male  1  | Member of the 100 Club  SM25-29 | 77.63%  CLUB'
+        parkrunner = results["parkrunner"].astype("string")
+        n_parkruns = parkrunner.str.extract(_N_PARKRUNS, expand=False)
+
+        # extract from results.Gender
+        # e.g. Female  127
+        gender = results["Gender"].astype("string").str.extract(_GENDER)
+
+        # extract from results['Age Group']
+        # e.g. SM25-2977.63% age grade, JM1065.00% age grade
+        age_group = results["Age Group"].astype("string").str.extract(_AGE_GROUP)
+
+        # extract from results.Time
+        # e.g. 16:37PB15:58, 17:05New PB!, 1:02:13First Timer!
+        time = results["Time"].astype("string").str.extract(_TIME)
+        # new PB, first timer or no PB info - current time is the PB
+        curr_pb = time["pb"].fillna(time["finish_time"])
+
+        finish_time_seconds = time_to_seconds(time["finish_time"])
+        curr_pb_seconds = time_to_seconds(curr_pb)
+
+        return pd.DataFrame(
+            {
+                "position": results["Position"].astype("Int64"),
+                "name": parkrunner.str.extract(_NAME, expand=False).str.strip(),
+                "n_parkruns": n_parkruns.fillna("0").astype("int"),
+                "gender": gender["gender"].str.strip(),
+                "gender_position": pd.to_numeric(gender["gender_position"]).astype("Int64"),
+                "club": results["Club"].astype("string"),
+                "full_age_group": age_group["full_age_group"],
+                "age_group": age_group["age_group"],
+                "age_grade": pd.to_numeric(age_group["age_grade"]).astype("float"),
+                "finish_time": time["finish_time"],
+                "curr_pb": curr_pb,
+                "finish_time_seconds": finish_time_seconds,
+                "curr_pb_seconds": curr_pb_seconds,
+                "finish_time_numeric": finish_time_seconds.astype("float") / 60,
+                "curr_pb_numeric": curr_pb_seconds.astype("float") / 60,
+            },
+            index=results.index,
+        )
 
     # plot data ----
-    def plot_dist_finish_times(self, by_gender=False) -> plt.Figure:
+    # matplotlib / seaborn are imported where used - optional, and not needed to scrape or parse
+    def plot_dist_finish_times(self, by_gender=False) -> "plt.Figure":
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         df = self.latest_results
 
         if by_gender == True:
@@ -177,7 +275,10 @@ class Parkrun:
 
         return plt
 
-    def plot_boxplot_finish_times(self, by=None) -> plt.Figure:
+    def plot_boxplot_finish_times(self, by=None) -> "plt.Figure":
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         df = self.latest_results
 
         if by == "age_group":
@@ -195,4 +296,19 @@ class Parkrun:
         plt.title("Distribution of finishing times")
         plt.tight_layout()
 
-        return plt
\ No newline at end of file
+        return plt
+
+
+def _parse_results_page(html) -> pd.DataFrame:
+    """Parse a results page into typed results, with its event name and run - runs in Parkrun.fetch_many's process pool"""
+    return _with_run_columns(
+        Parkrun.parse_results_html(html), Parkrun.parse_event_name(html), *Parkrun.parse_run_header(html)
+    )
+
+
+def _with_run_columns(results, event_name=None, run_number=None, run_date=None) -> pd.DataFrame:
+    return results.assign(
+        event_name=pd.Series(event_name, index=results.index, dtype="string"),
+        run_number=pd.array([run_number] * len(results), dtype="Int64"),
+        run_date=pd.Series(run_date, index=results.index, dtype="datetime64[ns]"),
+    )
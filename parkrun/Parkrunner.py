@@ -1,85 +1,331 @@
 # libs -----------------------------------------------
-import requests
 import numpy as np
 import pandas as pd
-import re
+import calendar
 import datetime
+import hashlib
+import itertools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import plotly.express as px
 import plotly.graph_objs as go
 
 from parkrun.constants import parkrun_url
 import parkrun.load_data as load_data
+from parkrun.figure_cache import figure_cache
+from parkrun.downsample import downsample_keeping
+from parkrun.attendance_cube import AttendanceCube
+from parkrun.results_index import ResultsIndex
+from parkrun.result_bundle import ParkrunnerResult, ALL_RESULTS_COLUMNS
+from parkrun.parsing import TIME_BASE_DATE, parse_athlete_page, time_to_seconds, seconds_to_datetime
+from parkrun.single_flight import SingleFlight
+from parkrun.profile_cache import profile_cache
+from parkrun.results_store import results_store
+from parkrun.rate_limit import BACKGROUND, INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+# concurrent loads of the same profile share one fetch and parse
+profile_flight = SingleFlight("profiles")
 
 
 # class for athlete data -----------------------------
 class Parkrunner:
     """Scrapes athlete data from athlete_id and returns data and charts"""
 
+    # ParkrunnerResult restored by from_result, until its tables are first used
+    _result = None
+    _tables = None
+
     def __init__(self, athlete_id):
         self.athlete_id = athlete_id
 
-    def fetch_data(self):
+    @property
+    def tables(self) -> dict:
+        """Summary stats, annual bests, all results and the download table - None until fetched"""
+        tables, result = self._tables, self._result
+        if tables is None and result is not None:
+            # restored from a ParkrunnerResult - derive the plotting and download columns on first use
+            all_results = self._add_time_columns(result.all_results.copy())
+            tables = self._tables = {
+                "summary_stats": result.summary_stats,
+                "annual_bests": result.annual_bests,
+                "all_results": all_results,
+                "all_results_dld": self._build_download_table(all_results),
+            }
+            self._result = None
+        # another thread may have just built them
+        return self._tables if tables is None else tables
+
+    @tables.setter
+    def tables(self, tables):
+        self._tables = tables
+        self._result = None
+
+    # Compact serialisation ----
+    def to_result(self) -> ParkrunnerResult:
+        """Slim copy of the parsed results - no raw page or derived tables"""
+        result = self._result
+        if result is not None:
+            return result
+        all_results = self.tables["all_results"]
+        return ParkrunnerResult(
+            athlete_id=self.athlete_id,
+            other_info=self.other_info,
+            summary_stats=self.tables["summary_stats"],
+            annual_bests=self.tables["annual_bests"],
+            all_results=all_results.loc[
+                :, [c for c in ALL_RESULTS_COLUMNS if c in all_results.columns]
+            ].reset_index(drop=True),
+        )
+
+    @classmethod
+    def from_result(cls, result: ParkrunnerResult) -> "Parkrunner":
+        """Rebuild a Parkrunner (without scraping) from a ParkrunnerResult"""
+        parkrunner = cls(result.athlete_id)
+        parkrunner.raw_scraped = None
+        parkrunner.other_info = result.other_info
+        # tables, indexes and aggregates are derived lazily - see Parkrunner.tables
+        parkrunner._result = result
+        return parkrunner
+
+    def __reduce__(self):
+        # pickle (e.g. Serverside store) through the compact result format, not the whole object
+        if self._result is None and self.tables is None:
+            return (type(self), (self.athlete_id,))
+        return (type(self).from_result, (self.to_result(),))
+
+    @classmethod
+    def load_profile(cls, athlete_id, progress=None, priority=INTERACTIVE) -> "Parkrunner":
+        """
+        Fetch and parse an athlete's profile, coalescing concurrent loads of the same athlete - callers
+        in this process wait for, and share, the in-flight load's Parkrunner; other worker processes
+        wait for it to finish, then rebuild from its published result rather than scraping again.
+        Profiles pre-parsed by warm_cache.py are served straight from the profile cache.
+        :param progress: passed to fetch_data() - only called by the load actually fetching
+        :param priority: rate limiter lane for the scrape - INTERACTIVE or BACKGROUND
+        """
+        key = str(athlete_id)
+        warmed = profile_cache.get(key)
+        if warmed is not None:
+            return cls.from_result(warmed)
+
+        def fetch():
+            parkrunner = cls(athlete_id)
+            parkrunner.fetch_data(progress=progress, priority=priority)
+            profile_flight.share(key, parkrunner.to_result().to_bytes())
+            return parkrunner
+
+        def recheck():
+            data = profile_flight.shared(key)
+            return cls.from_result(ParkrunnerResult.from_bytes(data)) if data is not None else None
+
+        return profile_flight.do(key, fetch, recheck=recheck)
+
+    @classmethod
+    def fetch_many(cls, athlete_ids, max_concurrency=8, priority=BACKGROUND):
+        """
+        Fetch and parse many athletes concurrently, yielding results as they complete.
+        Scraping is I/O bound and shares the pooled connections in load_data, so threads
+        are enough - wall-clock time approaches the slowest profile, not the sum.
+        :param athlete_ids: iterable of athlete ids
+        :param max_concurrency: max number of profiles fetched at once
+        :param priority: rate limiter lane for the scrapes - BACKGROUND by default, so batch fetches
+            don't hold up interactive lookups
+        :return: generator of (athlete_id, Parkrunner or None, exception or None)
+        """
+
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="parkrunner-fetch") as executor:
+            futures = {
+                executor.submit(cls.load_profile, athlete_id, priority=priority): athlete_id
+                for athlete_id in athlete_ids
+            }
+            for future in as_completed(futures):
+                athlete_id = futures[future]
+                try:
+                    yield athlete_id, future.result(), None
+                except Exception as e:
+                    yield athlete_id, None, e
+
+    def fetch_data(self, progress=None, priority=INTERACTIVE):
+        """
+        :param progress: optional callable, called with the stage ("fetching", then "parsing") as it starts
+        :param priority: rate limiter lane for the scrape - INTERACTIVE or BACKGROUND
+        """
         # scrape athlete data
-        self.raw_scraped = self.scrape_data()
+        if progress is not None:
+            progress("fetching")
+        self.raw_scraped = self.scrape_data(priority=priority)
+
+        # parse page once, then clean tables - other info comes straight from the page header
+        if progress is not None:
+            progress("parsing")
+        page = parse_athlete_page(
+            self.raw_scraped.content, encoding=self.raw_scraped.encoding or "utf-8"
+        )
+        self.tables = self.collect_tables(scraped_tables=page["tables"])
+        self.other_info = page["other_info"]
+        self.store_results()
+
+    def refresh(self, priority=INTERACTIVE):
+        """
+        Re-scrape and merge only new or corrected results into the previously parsed tables.
+        Falls back to a full fetch_data() if nothing has been fetched yet.
+        :param priority: rate limiter lane for the scrape - INTERACTIVE or BACKGROUND
+        """
+        if getattr(self, "tables", None) is None:
+            return self.fetch_data(priority=priority)
 
-        # collect tables and other info from scraped data
-        self.tables = self.collect_tables(raw_results=self.raw_scraped)
-        self.other_info = self.collect_other_info(raw_results=self.raw_scraped)
+        self.raw_scraped = self.scrape_data(priority=priority)
+        page = parse_athlete_page(
+            self.raw_scraped.content, encoding=self.raw_scraped.encoding or "utf-8"
+        )
+        self.tables = self.merge_tables(scraped_tables=page["tables"])
+        self.other_info = page["other_info"]
+        self.store_results()
+
+    def store_results(self):
+        """Persist the parsed results to the results store - skipped without pyarrow"""
+        if results_store is None:
+            return
+        try:
+            results_store.write_athlete_results(self.athlete_id, self.to_result().all_results)
+        except Exception:
+            # the store is a copy for cross-profile queries - never fail a profile load over it
+            logger.exception("Failed to store results for parkrunner %s", self.athlete_id)
 
     # Data scraping / collecting ----
-    def scrape_data(self):
+    def scrape_data(self, priority=INTERACTIVE):
         """Scrape athlete data"""
-        athlete_url = f"{parkrun_url}/parkrunner/{self.athlete_id}/all"
+        return load_data.scrape_url(self.athlete_url, priority=priority)
 
-        return load_data.scrape_url(athlete_url)
+    @property
+    def athlete_url(self):
+        return f"{parkrun_url}/parkrunner/{self.athlete_id}/all"
 
-    def collect_tables(self, raw_results) -> dict:
+    def collect_tables(self, scraped_tables) -> dict:
         """
-        :param raw_results: Raw scraped output from self.scrape_data()
+        :param scraped_tables: Raw tables parsed from the scraped page by parse_athlete_page()
         :return: Dictionary of summary statistics, annual bests and all results
         """
-        # scrape tables        
-        scraped_tables = pd.read_html(raw_results.text)
-        tables_map = {
-            # table : table number (index)
-            "summary_stats": 0,
-            "annual_bests": 1,
-            "all_results": 2,
-        }
-
-        scraped_tables = {k: scraped_tables[v] for k, v in tables_map.items()}
+        scraped_tables = dict(scraped_tables)
 
         # clean tables
-        all_results = scraped_tables["all_results"]
+        all_results = self._clean_all_results(scraped_tables["all_results"])
+        all_results = self._add_cumulative_fields(
+            all_results.sort_values("Run Date", kind="mergesort")
+        )
+
+        # update with cleaned table
+        scraped_tables["all_results"] = all_results
+        scraped_tables["all_results_dld"] = self._build_download_table(all_results)
+
+        return scraped_tables
+
+    def merge_tables(self, scraped_tables) -> dict:
+        """
+        Merge a fresh scrape into the previously collected tables - only runs that are new, or whose
+        row content changed (result corrections), are cleaned, and cumulative fields (Parkrun Number,
+        PBs) are only recomputed from the earliest of those runs onwards.
+        :param scraped_tables: Raw tables parsed from the scraped page by parse_athlete_page()
+        :return: Dictionary of summary statistics, annual bests and all results
+        """
+        scraped_tables = dict(scraped_tables)
+        previous = self.tables["all_results"]
+        raw = scraped_tables["all_results"]
+
+        row_keys, row_hashes = self._hash_rows(raw)
+        known_hashes = pd.Series(previous["Row_hash"].values, index=previous["Row_key"].values)
+        if not known_hashes.index.is_unique or not previous["Row_key"].isin(row_keys).all():
+            # duplicate or removed runs - can't merge safely, start again
+            return self.collect_tables(scraped_tables)
+
+        changed = (row_keys.map(known_hashes) != row_hashes).to_numpy()
+        if not changed.any():
+            all_results = previous
+        else:
+            updates = self._clean_all_results(raw[changed])
+
+            # runs before the first update keep their cumulative fields
+            before = previous["Run Date"] < updates["Run Date"].min()
+            head = previous[before]
+            tail = pd.concat(
+                [previous[~before & ~previous["Row_key"].isin(updates["Row_key"])], updates]
+            ).sort_values("Run Date", kind="mergesort")
+            tail = self._add_cumulative_fields(
+                tail,
+                n_before=len(head),
+                best_before=head["Time_seconds"].min() if len(head) else None,
+            )
+            all_results = pd.concat([head, tail], ignore_index=True)
+
+        scraped_tables["all_results"] = all_results
+        scraped_tables["all_results_dld"] = self._build_download_table(all_results)
+
+        return scraped_tables
+
+    def _clean_all_results(self, raw_all_results) -> pd.DataFrame:
+        """Per-run cleaning of the raw all results table - nothing that depends on other runs"""
+        all_results = raw_all_results.copy()
+        all_results["Row_key"], all_results["Row_hash"] = self._hash_rows(raw_all_results)
+
         all_results["Run Date"] = pd.to_datetime(
             all_results["Run Date"], format="%d/%m/%Y"
         )
 
-        all_results["Time_numeric"] = all_results["Time"].apply(self._convert_time_to_numeric)
-        # FIXME - clean up, not sure why we had 2
-        all_results["Time_datetime"] =  pd.to_datetime(
-            all_results["Time"].apply(self._convert_time_to_string),
-            format="%H:%M:%S"
-        )
+        # parse times once to integer seconds, derive other time columns from that
+        all_results["Time_seconds"] = time_to_seconds(all_results["Time"])
+        all_results = self._add_time_columns(all_results)
+
+        all_results.rename({"Pos": "Position"}, axis=1, inplace=True)
+
+        return all_results
+
+    @staticmethod
+    def _add_time_columns(all_results) -> pd.DataFrame:
+        """Time columns derived from Time_seconds - used for plotting"""
+        all_results["Time_numeric"] = all_results["Time_seconds"].astype("float") / 60
+        all_results["Time_datetime"] = seconds_to_datetime(all_results["Time_seconds"])
         all_results["Time_time"] = all_results["Time_datetime"].dt.time
+        return all_results
 
-        all_results = all_results.sort_values("Run Date")
-        all_results["Parkrun Number"] = (
-            all_results["Run Date"].rank(ascending=True).astype("int")
+    @staticmethod
+    def _hash_rows(raw_all_results):
+        """:return: (key identifying each run, hash of the run's full raw row) as uint64 Series"""
+        row_keys = pd.util.hash_pandas_object(
+            raw_all_results[["Event", "Run Date", "Run Number"]], index=False
         )
-        all_results.rename({"Pos": "Position"}, axis=1, inplace=True)
+        row_hashes = pd.util.hash_pandas_object(raw_all_results, index=False)
+        return row_keys, row_hashes
+
+    @staticmethod
+    def _add_cumulative_fields(all_results, n_before=0, best_before=None) -> pd.DataFrame:
+        """
+        Add Parkrun Number and PB flag to runs sorted by Run Date
+        :param n_before: number of earlier runs not included in all_results
+        :param best_before: best time (seconds) over those earlier runs
+        """
+        all_results = all_results.copy()
+        all_results["Parkrun Number"] = (
+            all_results["Run Date"].rank(ascending=True) + n_before
+        ).astype("int")
+
+        best = all_results["Time_seconds"].cummin()
+        if best_before is not None:
+            best = best.clip(upper=best_before)
+        all_results["Is_PB"] = (all_results["Time_seconds"] == best).fillna(False).astype("bool")
 
-        # extra cleaning for download
-        all_results_dld = (
+        return all_results
+
+    @staticmethod
+    def _build_download_table(all_results) -> pd.DataFrame:
+        """Extra cleaning of all results for download / display"""
+        return (
             all_results
             # tag PBs
-            .sort_values("Run Date", ascending=True)
-            .assign(
-                PB=lambda df: np.where(
-                    df.Time_numeric == df.Time_numeric.cummin(), "⭐", None
-                )
-            )
+            .assign(PB=lambda df: np.where(df.Is_PB, "⭐", None))
             # reorder
             .loc[
                 :,
@@ -94,48 +340,102 @@ class Parkrunner:
                 ],
             ]
             .sort_values("Run Date", ascending=False)
-            .assign(**{"Run Date": lambda df: df["Run Date"].apply(lambda x: x.date())})
+            .assign(**{"Run Date": lambda df: df["Run Date"].dt.date})
         )
 
-        # update with cleaned table
-        scraped_tables["all_results"] = all_results
-        scraped_tables["all_results_dld"] = all_results_dld
-
-        return scraped_tables
-
-    def collect_other_info(self, raw_results) -> dict:
+    @property
+    def results_index(self) -> ResultsIndex:
+        """Event / date / PB index over all_results - rebuilt only when all_results is replaced"""
+        all_results = self.tables["all_results"]
+        index = getattr(self, "_results_index", None)
+        if index is None or index.all_results is not all_results:
+            index = self._results_index = ResultsIndex(all_results)
+        return index
+
+    @property
+    def attendance_cube(self) -> AttendanceCube:
+        """Year x month attendance cube - extended in place when runs are appended to all_results"""
+        all_results = self.tables["all_results"]
+        cube = getattr(self, "_attendance_cube", None)
+        if cube is None or (cube.all_results is not all_results and not cube.update(all_results)):
+            cube = self._attendance_cube = AttendanceCube(all_results)
+        return cube
+
+    @property
+    def event_stats(self) -> pd.DataFrame:
         """
-        :param raw_results: Raw scraped output from self.scrape_data()
-        :return: Dictionary of info such as athlete_name and number of parkruns
+        Per-event aggregates, in one groupby over all_results - shared by the map, summary and box plot
+        :return: One row per event (index) - n_runs, first_date, last_date, pb_seconds, median_seconds,
+            mean_age_grade
         """
+        all_results = self.tables["all_results"]
+        cached = getattr(self, "_event_stats", None)
+        if cached is not None and cached[0] is all_results:
+            return cached[1]
+
+        event_stats = (
+            all_results.assign(
+                time=all_results["Time_seconds"].astype("float"),
+                age_grade=pd.to_numeric(
+                    all_results["Age Grade"].astype("string").str.rstrip("%"), errors="coerce"
+                ),
+            )
+            .groupby("Event", sort=False)
+            .agg(
+                n_runs=("Run Date", "size"),
+                first_date=("Run Date", "min"),
+                last_date=("Run Date", "max"),
+                pb_seconds=("time", "min"),
+                median_seconds=("time", "median"),
+                mean_age_grade=("age_grade", "mean"),
+            )
+        )
+        self._event_stats = (all_results, event_stats)
+        return event_stats
 
-        # scrape other info
-        other_info_map = {
-            # info : [string_search_start, string_search_end]
-            "athlete_name": [
-                "<h2>",
-                '\xa0<span style="font-weight: normal;" title="parkrun ID"',
-            ],
-            # "milestone_club": ["Member of the parkrun", "Club"],
-            "nbr_parkruns": ["<h3>\n", "parkruns total"],
-            "last_age_category": ["Most recent age category was ", "\n"],
-        }
-
-        other_info = {
-            k: re.search(v[0] + "(.*)" + v[1], raw_results.text).group(1).strip()
-            for k, v in other_info_map.items()
-        }
+    # Plot output ----
+    @property
+    def data_version(self) -> str:
+        """Content hash of the parsed results - changes whenever any run is added or corrected"""
+        result = self._result
+        # a restored profile's hash doesn't need its tables built
+        all_results = result.all_results if result is not None else self.tables["all_results"]
+        row_hashes = np.sort(all_results["Row_hash"].to_numpy(dtype="uint64"))
+        return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+    def cached_figure(self, plot_name, **kwargs) -> dict:
+        """
+        Plotly figure (as a dict, ready for dcc.Graph) from one of the plot_* methods, served from
+        the figure cache when the same athlete data and arguments have been plotted before
+        :param plot_name: e.g. "plot_finishing_times"
+        :param kwargs: arguments to the plot method
+        """
+        key = (
+            str(self.athlete_id),
+            self.data_version,
+            plot_name,
+            json.dumps(kwargs, sort_keys=True, default=str),
+            # plots can depend on today's date, e.g. heatmap months up to now
+            datetime.date.today().isoformat(),
+        )
+        fig = figure_cache.get(key)
+        if fig is None:
+            fig = getattr(self, plot_name)(**kwargs).to_dict()
+            figure_cache.set(key, fig)
 
-        return other_info
+        # shared by every caller - serialised as-is by dcc.Graph, don't modify it
+        return fig
 
-    # Plot output ----
     def plot_finishing_times(
         self,
         filter_parkrun=None,
         show_PB_only=False,
-        filter_start=pd.Timestamp.min,
-        filter_end=pd.Timestamp.max,
+        filter_start=None,
+        filter_end=None,
         show_num_events=None,
+        webgl_threshold=500,
+        max_points=1000,
+        max_trend_points=250,
     ) -> go.Figure:
         """
         Note - Expects Run Date to be datetime and Time_numeric column to be created
@@ -143,33 +443,34 @@ class Parkrunner:
         :param show_num_events: number of events (points) to show in chart
         :param filter_parkrun: name of parkrun event to filter to
         :param show_PB_only: filter PBs only - if parkrun filtered, shows PBs for that parkrun
+        :param filter_start, filter_end: inclusive Run Date window - None for unbounded
+        :param webgl_threshold: above this many points, draw with WebGL (Scattergl) rather than SVG
+        :param max_points: above this many points, markers are LTTB downsampled - PBs are always kept
+        :param max_trend_points: the trend line is LTTB downsampled to this many points (plus PBs)
         :return: Plot of parkrun finish times over all events from all_results table
         """
 
-        df = self.tables["all_results"]
-
-        # filter parkrun before PBs so PBs are for specific parkrun
-        if filter_parkrun is not None:
-            df = df[df.Event == filter_parkrun]
-
-        # required calcs
-        df["PB_times"] = df["Time"][(df["Time_numeric"] == df["Time_numeric"].cummin())]
-        df["PB_times_numeric"] = df["Time_numeric"][
-            (df["Time_numeric"] == df["Time_numeric"].cummin())
-        ]
-
-        # filter dates
-        df = df[df["Run Date"].between(filter_start, filter_end)]
-
-        # filter PB only
-        if show_PB_only:
-            df = df[df.Time == df.PB_times]
+        # filter from the precomputed index - if parkrun filtered, PBs are for that parkrun
+        positions, is_pb = self.results_index.select(
+            event=filter_parkrun,
+            start=filter_start,
+            end=filter_end,
+            pb_only=show_PB_only,
+            last_n=show_num_events,
+        )
+        df = self.tables["all_results"].iloc[positions]
 
-        # subset after PB calcs
-        if show_num_events:
-            df = df.tail(show_num_events)
+        # bound figure size for long histories - downsample, keeping the shape of the series and all PBs
+        run_days = df["Run Date"].to_numpy(dtype="datetime64[D]").astype("int64")
+        seconds = df["Time_seconds"].astype("float").ffill().bfill().to_numpy()
+        if max_points is not None and len(df) > max_points:
+            keep = downsample_keeping(run_days, seconds, max_points, keep=is_pb)
+            df, is_pb = df.iloc[keep], is_pb[keep]
+            run_days, seconds = run_days[keep], seconds[keep]
+        trend = df.iloc[downsample_keeping(run_days, seconds, max_trend_points, keep=is_pb)]
 
-        df_pb = df[~pd.isnull(df.PB_times_numeric)]
+        use_webgl = len(df) > webgl_threshold
+        Scatter = go.Scattergl if use_webgl else go.Scatter
 
         ### build plot - ty chatgpt for converting from matplotlib
 
@@ -188,14 +489,15 @@ class Parkrunner:
             color_discrete_map=color_map,
             labels={"Time": "Finishing time", "Run Date": "Parkrun date"},
             hover_data={"Event": True, "Time": True, "Time_numeric": False},
+            render_mode="webgl" if use_webgl else "svg",
         )
         scatter.update_traces(marker=dict(size=12))
 
         # Add a dotted line through all the points
         scatter.add_trace(
-            go.Scatter(
-                x=df["Run Date"],
-                y=df["Time_numeric"],
+            Scatter(
+                x=trend["Run Date"],
+                y=trend["Time_numeric"],
                 mode="lines",
                 line=dict(color="DarkSlateGrey", dash="dot"),
                 name="Trend",
@@ -204,9 +506,9 @@ class Parkrunner:
         )
 
         # Add a circle border around personal best time data points
-        pb_points = df.loc[df["Time_numeric"] == df["PB_times_numeric"]]
+        pb_points = df[is_pb]
         scatter.add_trace(
-            go.Scatter(
+            Scatter(
                 x=pb_points["Run Date"],
                 y=pb_points["Time_numeric"],
                 mode="markers",
@@ -266,9 +568,11 @@ class Parkrunner:
 
         return scatter
 
-    def plot_boxplot_times_by_event(self, order_by="time") -> go.Figure:
+    def plot_boxplot_times_by_event(self, order_by="time", max_points=300) -> go.Figure:
         """
         :param order_by: Order y axis by - accepted arguments 'events' and 'time'
+        :param max_points: show every run as a point up to this many runs - above it, boxes are drawn
+            from precomputed quartiles / whiskers and only outliers are sent as points
         :return: Boxplot of finishing times by event
         """
 
@@ -278,49 +582,105 @@ class Parkrunner:
             )
 
         df = self.tables["all_results"]
+        box_stats = self._box_stats_by_event(df, self.event_stats)
 
-        # add participation count to Event y axis label, get n_event and avg_time to order by
-        df = df.assign(
-            n_event=lambda x: x.groupby("Event")["Run Date"].transform("nunique"),
-            Event_append=lambda x: x.Event + " [" + x.n_event.astype("str") + "]",
-            min_time=lambda x: x.groupby("Event")["Time_time"].transform("min"),
+        # add participation count to Event y axis label, order by n_event or min_time
+        box_stats["Event_append"] = (
+            box_stats.index + " [" + box_stats.n_event.astype("str") + "]"
         )
         if order_by == "time":
-            df = df.sort_values("min_time")
+            box_stats = box_stats.sort_values("min_time", kind="mergesort")
         else:
-            df = df.sort_values("n_event", ascending=False)
+            box_stats = box_stats.sort_values("n_event", ascending=False, kind="mergesort")
+
+        aggregated = len(df) > max_points
+        if aggregated:
+            # only outliers are drawn as points
+            df = df[
+                (df.Time_seconds < df.Event.map(box_stats.lowerfence))
+                | (df.Time_seconds > df.Event.map(box_stats.upperfence))
+            ]
+        runs_by_event = df.groupby("Event", sort=False).indices
+
+        hovertemplate = "<br>".join(
+            [
+                "Event: %{customdata[2]}",
+                "Count of attendances: %{customdata[1]}",
+                "Run date: %{customdata[0]}",
+                "Finishing time: %{y}",
+            ]
+        )
 
         fig = go.Figure()
 
-        colours = px.colors.qualitative.Dark24[: df["Event"].unique().size]
-        for event, colour in zip(df["Event"].unique(), colours):
-            dff = df[df["Event"] == event]
+        colours = itertools.cycle(px.colors.qualitative.Dark24)
+        for (event, stats), colour in zip(box_stats.iterrows(), colours):
+            dff = df.iloc[runs_by_event.get(event, [])]
+            customdata = np.stack(
+                (
+                    dff["Run Date"].astype("str"),
+                    np.full(len(dff), stats.n_event),
+                    np.full(len(dff), event, dtype="object"),
+                ),
+                axis=-1,
+            )
+
+            if not aggregated:
+                fig.add_trace(
+                    go.Box(
+                        y=dff["Time_datetime"],
+                        x=np.full(len(dff), stats.Event_append, dtype="object"),
+                        name=event,
+                        marker_color=colour,
+                        boxpoints="all",
+                        customdata=customdata,
+                        hovertemplate=hovertemplate,
+                    )
+                )
+                continue
+
             fig.add_trace(
                 go.Box(
-                    y=dff["Time_datetime"],
-                    x=dff["Event_append"],
+                    x=[stats.Event_append],
+                    q1=[self._seconds_to_plot_time(stats.q1)],
+                    median=[self._seconds_to_plot_time(stats["median"])],
+                    q3=[self._seconds_to_plot_time(stats.q3)],
+                    lowerfence=[self._seconds_to_plot_time(stats.lowerfence)],
+                    upperfence=[self._seconds_to_plot_time(stats.upperfence)],
                     name=event,
+                    legendgroup=event,
                     marker_color=colour,
-                    boxpoints="all",
-                    customdata=np.stack(
-                        (dff["Run Date"].astype("str"), dff["n_event"], dff["Event"]),
-                        axis=-1,
-                    ),
-                    hovertemplate="<br>".join(
-                        [
-                            "Event: %{customdata[2]}",
-                            "Count of attendances: %{customdata[1]}",
-                            "Run date: %{customdata[0]}",
-                            "Finishing time: %{y}",
-                        ]
-                    ),
+                    boxpoints=False,
+                    hoverinfo="name+y",
                 )
             )
+            if len(dff):
+                fig.add_trace(
+                    go.Scatter(
+                        y=dff["Time_datetime"],
+                        x=np.full(len(dff), stats.Event_append, dtype="object"),
+                        name=event,
+                        legendgroup=event,
+                        showlegend=False,
+                        mode="markers",
+                        marker_color=colour,
+                        customdata=customdata,
+                        hovertemplate=hovertemplate,
+                    )
+                )
 
-        fig.update_yaxes(tickformat="%M:%S")
         fig.update_layout(
             height=600,
-            yaxis=dict(scaleanchor="x", scaleratio=1, autorange="reversed"),
+            # explicit date axis - precomputed box stats are strings, so plotly can't infer the type,
+            # and ticks / hover should read the same either side of max_points
+            yaxis=dict(
+                type="date",
+                tickformat="%M:%S",
+                hoverformat="%M:%S",
+                scaleanchor="x",
+                scaleratio=1,
+                autorange="reversed",
+            ),
             xaxis=dict(rangeslider=dict(visible=True)),
             xaxis_title="Parkrun location and attendances",
             yaxis_title="Finishing time (mins)",
@@ -351,61 +711,20 @@ class Parkrunner:
         :return: Heatmap of attendance count by year / month
         """
 
-        def tag_year_month(df, date_col):
-            """Helper function for this heatmap - assign year / month"""
-            return df.assign(
-                year=lambda x: x[date_col].dt.year,
-                month_int=lambda x: x[date_col].dt.month,
-                month=lambda x: x[date_col].dt.month_name(),
-            )
-
-        # tag parkrunner run dates with year/month
-        participation = tag_year_month(
-            df=self.tables["all_results"], date_col="Run Date"
-        )
-        run_dates = self.tables["all_results"]["Run Date"]
-
-        # create mapping table of all year/months to ensure completeness if no participation in some months
-        dates = pd.date_range(
-            run_dates.min().replace(day=1),  # floor first date
-            datetime.datetime.now(),
-            freq="MS",
-        )
-        all_dates = tag_year_month(df=pd.DataFrame({"dates": dates}), date_col="dates")
-
-        # count attendance
-        participation = (
-            all_dates.merge(participation, how="left")
-            .groupby(["year", "month", "month_int"])
-            .agg(
-                count=("Run Date", "nunique"),
-                parkruns=("Event", lambda x: x.str.cat(sep=", ")),
-                times=("Time_datetime", lambda x: x.astype("str").str.cat(sep=", ")),
-            )
-            .sort_values(["year", "month_int"])
-            .reset_index()
-        )
-        participation["combined"] = [
-            ([x], [y]) for x, y in zip(participation.parkruns, participation.times)
+        # counts and runs per year / month come from the precomputed cube - months with no
+        # participation are 0, months before the first parkrun or after this month are blank
+        years, counts, runs = self.attendance_cube.grid()
+        months = list(calendar.month_name)[1:]
+        z1 = pd.DataFrame(counts, index=years, columns=months)
+
+        # customdata for hover - parkrun locations and times in each month
+        events = self.tables["all_results"]["Event"].to_numpy(dtype="str")
+        times = self.tables["all_results"]["Time"].to_numpy(dtype="str")
+        z2 = [
+            [[", ".join(events[cell]), ", ".join(times[cell])] for cell in year_runs]
+            for year_runs in runs
         ]
 
-        months = (
-            participation.loc[:, ["month", "month_int"]]
-            .drop_duplicates()
-            .sort_values("month_int")["month"]
-            .to_list()
-        )
-
-        # pivot data for heatmap
-        z1 = participation.pivot(index=["year"], columns="month", values="count").loc[
-            :, months
-        ]
-
-        # pivot customdata for z2
-        z2 = participation.pivot(
-            index=["year"], columns="month", values="combined"
-        ).loc[:, months]
-
         fig = px.imshow(
             z1,
             labels=dict(x="Month", y="Year", color="Number of parkruns"),
@@ -427,30 +746,37 @@ class Parkrunner:
         return fig
 
     # helper functions -----
-    def _extract_time(self, time_str):
-        parts = time_str.split(':')
-        
-        hours = 0
-        minutes = 0
-        seconds = 0
-        
-        if len(parts) == 3:  # 'hh:mm:ss' format
-            hours, minutes, seconds = int(parts[0]), int(parts[1]), int(parts[2])
-        elif len(parts) == 2:  # 'mm:ss' format
-            minutes, seconds = int(parts[0]), int(parts[1])
-        else:
-            raise ValueError("Invalid time format")
-        
-        return hours, minutes, seconds
-
-    def _convert_time_to_numeric(self, time_str):
-        """Helper function to convert mm:ss times to numeric"""
-        hours, minutes, seconds = self._extract_time(time_str)
-        return hours * 60 + minutes + seconds / 60
-
-    def _convert_time_to_string(self, time_str): 
-        hours, minutes, seconds = self._extract_time(time_str)
-        return f"{hours}:{minutes}:{seconds}"
+    @staticmethod
+    def _box_stats_by_event(all_results, event_stats) -> pd.DataFrame:
+        """
+        Box plot statistics of finishing times per event - count, min and median come from event_stats
+        :return: One row per event - n_event, min_time, q1, median, q3 and Tukey (1.5 IQR) whiskers, in seconds
+        """
+        times = all_results["Time_seconds"].astype("float")
+        grouped = times.groupby(all_results["Event"], sort=False)
+        box_stats = pd.DataFrame(
+            {
+                "n_event": event_stats.n_runs,
+                "min_time": event_stats.pb_seconds,
+                "q1": grouped.quantile(0.25),
+                "median": event_stats.median_seconds,
+                "q3": grouped.quantile(0.75),
+            }
+        )
+
+        # whiskers reach the furthest runs within 1.5 IQR of the box
+        iqr = box_stats.q3 - box_stats.q1
+        low = all_results["Event"].map(box_stats.q1 - 1.5 * iqr)
+        high = all_results["Event"].map(box_stats.q3 + 1.5 * iqr)
+        box_stats["lowerfence"] = times.where(times >= low).groupby(all_results["Event"], sort=False).min()
+        box_stats["upperfence"] = times.where(times <= high).groupby(all_results["Event"], sort=False).max()
+
+        return box_stats
+
+    @staticmethod
+    def _seconds_to_plot_time(seconds) -> str:
+        """Seconds to a datetime string on the same base date as Time_datetime, for precomputed box stats"""
+        return str(TIME_BASE_DATE + pd.Timedelta(seconds=float(seconds)))
 
     def _label_point(self, x, y, val, ax):
         """Helper function to add labels - assumes x axis is datetime (for Run Date)"""
@@ -0,0 +1,96 @@
+"""Year x month attendance cube over a parkrunner's results"""
+import numpy as np
+import pandas as pd
+
+
+class AttendanceCube:
+    """
+    Compact year x month view of attendance:
+    - counts[year, month] - number of distinct run dates
+    - runs for a cell are run_positions[offsets[cell]:offsets[cell + 1]], positions into all_results,
+      where cell = year * 12 + month (0-based, years counted from first_year)
+
+    Built with vectorised ops, and extended in place when runs are appended to all_results
+    (see update), so rendering the heatmap needs no groupby.
+    """
+
+    def __init__(self, all_results: pd.DataFrame):
+        self.all_results = all_results
+        self._row_keys = all_results["Row_key"].to_numpy()
+        self._dates = all_results["Run Date"].to_numpy(dtype="datetime64[D]")
+
+        self.first_year = int(self._dates.min().astype("datetime64[Y]").astype(int) + 1970)
+        cells = self._cells(self._dates)
+        n_cells = (cells.max() // 12 + 1) * 12
+        self.run_positions = np.argsort(cells, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=n_cells))])
+        self.counts = np.zeros(n_cells, dtype="int64")
+        self._recount(np.unique(cells))
+
+    def _cells(self, dates) -> np.ndarray:
+        months = dates.astype("datetime64[M]").astype("int64")  # months since 1970-01
+        return months - (self.first_year - 1970) * 12
+
+    def _recount(self, cells):
+        """Distinct run dates for the given cells"""
+        for cell in cells:
+            runs = self.run_positions[self.offsets[cell]:self.offsets[cell + 1]]
+            self.counts[cell] = len(np.unique(self._dates[runs]))
+
+    def update(self, all_results: pd.DataFrame) -> bool:
+        """
+        Extend the cube with runs appended to all_results since it was built.
+        :return: False (cube unchanged) if earlier runs changed too - the cube needs rebuilding
+        """
+        n = len(self._row_keys)
+        row_keys = all_results["Row_key"].to_numpy()
+        if len(row_keys) < n or not np.array_equal(row_keys[:n], self._row_keys):
+            return False
+
+        new_dates = all_results["Run Date"].iloc[n:].to_numpy(dtype="datetime64[D]")
+        new_cells = self._cells(new_dates)
+        if len(new_cells) and new_cells.min() < 0:
+            return False
+
+        # grow to whole years covering the new runs
+        n_cells = max(len(self.counts), (new_cells.max() // 12 + 1) * 12 if len(new_cells) else 0)
+        self.counts = np.pad(self.counts, (0, n_cells - len(self.counts)))
+        self.offsets = np.pad(self.offsets, (0, n_cells + 1 - len(self.offsets)), mode="edge")
+
+        # insert new positions at the end of their cells' runs
+        order = np.argsort(new_cells, kind="stable")
+        self.run_positions = np.insert(
+            self.run_positions, self.offsets[new_cells[order] + 1], np.arange(n, n + len(new_cells))[order]
+        )
+        self.offsets[1:] += np.cumsum(np.bincount(new_cells, minlength=n_cells))
+
+        self.all_results = all_results
+        self._row_keys = row_keys
+        self._dates = np.concatenate([self._dates, new_dates])
+        self._recount(np.unique(new_cells))
+        return True
+
+    def grid(self, until=None):
+        """
+        :param until: last month to show (default now) - cells after it, and before the first run, are NaN
+        :return: (years, counts as a years x 12 float array, runs per cell as a years x 12 nested list)
+        """
+        until = pd.Timestamp.now() if until is None else pd.Timestamp(until)
+        last_cell = (until.year - self.first_year) * 12 + until.month - 1
+        n_cells = max(len(self.counts), (last_cell // 12 + 1) * 12)
+        first_cell = int(self._cells(self._dates.min().reshape(1))[0])
+
+        counts = np.full(n_cells, np.nan)
+        counts[: len(self.counts)] = self.counts
+        counts[len(self.counts):] = 0
+        counts[:first_cell] = np.nan
+        counts[last_cell + 1:] = np.nan
+
+        runs = [
+            self.run_positions[self.offsets[cell]:self.offsets[cell + 1]]
+            if cell < len(self.counts) else np.array([], dtype="int64")
+            for cell in range(n_cells)
+        ]
+        n_years = n_cells // 12
+        years = list(range(self.first_year, self.first_year + n_years))
+        return years, counts.reshape(n_years, 12), [runs[y * 12:(y + 1) * 12] for y in range(n_years)]
@@ -1,5 +1,12 @@
 """Constants file for file paths"""
+import os
 
 parkrun_url = 'https://www.parkrun.com.au/'
 
 events_url = "https://images.parkrun.com/events.json"
+
+# local cache of scraped pages and parsed results - override with PARKRUN_CACHE_DIR
+cache_dir = os.environ.get(
+    "PARKRUN_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "parkrun-results")
+)
@@ -0,0 +1,52 @@
+"""Downsampling of time series for plotting"""
+import numpy as np
+
+
+def lttb(x, y, n_out) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets - picks n_out points that keep the visual shape of the series.
+    The first and last points are always kept; every other bucket keeps the point forming the
+    largest triangle with the previously kept point and the average of the next bucket.
+    :param x, y: numeric arrays of equal length, x sorted ascending
+    :param n_out: number of points to keep
+    :return: sorted positions of the kept points
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    if n <= n_out or n < 3:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+
+    # bucket edges over the points between the first and last
+    edges = np.linspace(1, n - 1, n_out - 1).astype("int64")
+    kept = np.empty(n_out, dtype="int64")
+    kept[0], kept[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket (the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+
+    return kept
+
+
+def downsample_keeping(x, y, n_out, keep=None) -> np.ndarray:
+    """
+    LTTB downsample of (x, y), plus any positions flagged in `keep` (e.g. PBs), which are never dropped
+    :param keep: boolean mask of points to always keep
+    :return: sorted positions of the kept points
+    """
+    positions = lttb(x, y, n_out)
+    if keep is not None:
+        positions = np.union1d(positions, np.flatnonzero(keep))
+    return positions
@@ -0,0 +1,125 @@
+"""In-process catalogue of parkrun events, indexed for fast lookup"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from parkrun.constants import events_url
+import parkrun.load_data as load_data
+from parkrun.rate_limit import INTERACTIVE, BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+
+ParkrunEvent = namedtuple(
+    "ParkrunEvent",
+    ["id", "name", "short_name", "long_name", "country_code", "series_id", "location", "lat", "lon"],
+)
+
+
+class Catalogue:
+    """Immutable snapshot of events.json, indexed by EventShortName, event id and country code"""
+
+    __slots__ = ("events", "by_short_name", "by_id", "by_country", "loaded_at", "load_seconds", "n_bytes")
+
+    def __init__(self, events, loaded_at, load_seconds, n_bytes):
+        self.events = tuple(events)
+        self.by_short_name = {e.short_name: e for e in self.events}
+        self.by_id = {e.id: e for e in self.events}
+        self.by_country = {}
+        for e in self.events:
+            self.by_country.setdefault(e.country_code, []).append(e)
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+        self.n_bytes = n_bytes
+
+    @classmethod
+    def from_features(cls, features, **kwargs):
+        events = [
+            ParkrunEvent(
+                id=f["id"],
+                name=f["properties"].get("eventname"),
+                short_name=f["properties"]["EventShortName"],
+                long_name=f["properties"]["EventLongName"],
+                country_code=f["properties"]["countrycode"],
+                series_id=f["properties"].get("seriesid"),
+                location=f["properties"].get("EventLocation"),
+                # geojson coordinates are [lon, lat]
+                lon=f["geometry"]["coordinates"][0],
+                lat=f["geometry"]["coordinates"][1],
+            )
+            for f in features
+        ]
+        return cls(events, **kwargs)
+
+    def lookup(self, short_names) -> list:
+        """Events for the given EventShortNames, in the order given - unknown names are skipped"""
+        return [self.by_short_name[n] for n in short_names if n in self.by_short_name]
+
+    def __len__(self):
+        return len(self.events)
+
+
+class EventsCatalogue:
+    """
+    Loads events.json once per process and refreshes it every `refresh_seconds`.
+
+    The first call to get() blocks while the catalogue is downloaded and indexed; after that a
+    stale catalogue keeps being served while a background thread refreshes it.
+    """
+
+    def __init__(self, refresh_seconds=24 * 3600):
+        self.refresh_seconds = refresh_seconds
+        self._catalogue = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def load(self, priority=INTERACTIVE) -> Catalogue:
+        """Download and index the catalogue (blocking), replacing the current one"""
+        start = time.perf_counter()
+        events_raw = load_data.scrape_url(events_url, priority=priority)
+        features = json.loads(events_raw.content)["events"]["features"]
+        catalogue = Catalogue.from_features(
+            features,
+            loaded_at=time.time(),
+            load_seconds=time.perf_counter() - start,
+            n_bytes=len(events_raw.content),
+        )
+        logger.info(
+            "Loaded %d parkrun events (%.1f MB) in %.2fs",
+            len(catalogue), catalogue.n_bytes / 1e6, catalogue.load_seconds,
+        )
+        self._catalogue = catalogue
+        return catalogue
+
+    def get(self) -> Catalogue:
+        catalogue = self._catalogue
+        if catalogue is None:
+            with self._lock:
+                if self._catalogue is None:
+                    return self.load()
+                return self._catalogue
+
+        if time.time() - catalogue.loaded_at > self.refresh_seconds:
+            self._refresh_in_background()
+        return catalogue
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.load(priority=BACKGROUND)
+            except Exception:
+                logger.exception("Failed to refresh parkrun events catalogue - keeping stale copy")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="events-catalogue-refresh", daemon=True).start()
+
+
+events_catalogue = EventsCatalogue()
@@ -0,0 +1,126 @@
+"""Export parkrunner results tables in several formats, streamed in chunks and cached"""
+import io
+import threading
+import zlib
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional - only needed for parquet exports
+    pa = None
+
+
+# format : (file extension, mime type)
+EXPORT_FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "jsonl": ("jsonl", "application/x-ndjson"),
+}
+
+
+# encoders --------------------------------------------
+def _iter_csv(df, chunk_rows):
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode("utf-8")
+
+
+def _iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 - gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _iter_jsonl(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_json(
+            orient="records", lines=True, date_format="iso", force_ascii=False
+        ).rstrip("\n").encode("utf-8") + b"\n"
+
+
+def _iter_parquet(df, chunk_rows):
+    if pa is None:
+        raise ImportError("Parquet export requires pyarrow - pip install pyarrow")
+    sink = io.BytesIO()
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for start in range(0, len(df), chunk_rows):
+            # one row group per chunk - hand over whatever has been written so far
+            writer.write_table(
+                pa.Table.from_pandas(df.iloc[start:start + chunk_rows], schema=schema, preserve_index=False)
+            )
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def iter_export(df: pd.DataFrame, fmt="csv", chunk_rows=5000):
+    """
+    Encode df in chunks of `chunk_rows` rows
+    :param fmt: one of EXPORT_FORMATS
+    :return: generator of bytes - concatenated, they are the complete file
+    """
+    if fmt == "csv":
+        return _iter_csv(df, chunk_rows)
+    if fmt == "csv.gz":
+        return _iter_gzip(_iter_csv(df, chunk_rows))
+    if fmt == "jsonl":
+        return _iter_jsonl(df, chunk_rows)
+    if fmt == "parquet":
+        return _iter_parquet(df, chunk_rows)
+    raise ValueError(f"Export format `{fmt}` not in accepted formats - {', '.join(EXPORT_FORMATS)}.")
+
+
+# cache -----------------------------------------------
+class ExportCache:
+    """Thread-safe LRU of encoded exports, bounded by total bytes"""
+
+    def __init__(self, max_bytes=64 * 1024**2):
+        self.max_bytes = max_bytes
+        self._exports = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._exports.get(key)
+            if data is not None:
+                self._exports.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        with self._lock:
+            if key in self._exports:
+                self._n_bytes -= len(self._exports.pop(key))
+            self._exports[key] = data
+            self._n_bytes += len(data)
+            while self._n_bytes > self.max_bytes and len(self._exports) > 1:
+                _, evicted = self._exports.popitem(last=False)
+                self._n_bytes -= len(evicted)
+
+
+export_cache = ExportCache()
+
+
+def export_results(parkrunner, fmt="csv", table="all_results_dld") -> bytes:
+    """
+    Encoded export of one of a parkrunner's tables, cached per athlete, data version and format
+    :return: file contents
+    """
+    key = (str(parkrunner.athlete_id), parkrunner.data_version, table, fmt)
+    data = export_cache.get(key)
+    if data is None:
+        data = b"".join(iter_export(parkrunner.tables[table], fmt))
+        export_cache.set(key, data)
+    return data
+
+
+def export_filename(athlete_id, fmt="csv") -> str:
+    return f"results-{athlete_id}.{EXPORT_FORMATS[fmt][0]}"
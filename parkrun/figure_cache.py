@@ -0,0 +1,41 @@
+"""In-process LRU cache of built Plotly figures"""
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    """
+    Thread-safe LRU of figure dicts. Keys are built by the caller - for Parkrunner plots
+    that's (athlete id, data version, plot name, arguments), see Parkrunner.cached_figure().
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is None:
+                self.misses += 1
+                return None
+            self._figures.move_to_end(key)
+            self.hits += 1
+            return fig
+
+    def set(self, key, fig):
+        with self._lock:
+            self._figures[key] = fig
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+
+figure_cache = FigureCache()
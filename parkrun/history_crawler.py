@@ -0,0 +1,192 @@
+"""
+Resumable crawl of an event's full results history (/results/{n}/ for every run) into the ResultsStore
+
+Run from the repo root:
+    python -m parkrun.history_crawler theponds [--max-concurrency 4]
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from parkrun.constants import cache_dir
+from parkrun.Parkrun import Parkrun
+from parkrun.rate_limit import BACKGROUND
+from parkrun.results_store import ResultsStore
+
+logger = logging.getLogger(__name__)
+
+_TABLE = re.compile(r"<table\b", re.IGNORECASE)
+
+
+class HistoryCrawler:
+    """
+    Walks an event's run numbers, from 1 to the latest run, with bounded concurrency.
+
+    Each run is parsed with Parkrun.collect_latest_results and written to the ResultsStore as its own
+    partition - the store is append-only, and runs already in it are never fetched again. Progress
+    (latest run number, runs with no results table, failures) is checkpointed to a JSON file after
+    every run, so an interrupted crawl resumes where it stopped.
+    """
+
+    def __init__(self, event_url_name, store: ResultsStore = None, max_concurrency=4,
+                 checkpoint_dir=os.path.join(cache_dir, "crawls"), max_attempts=3):
+        """
+        :param max_concurrency: max run pages fetched / parsed at once - requests are also throttled
+                                by the shared rate limiter, in its background lane
+        :param max_attempts: runs failing this many times are skipped on later resumes
+        """
+        self.event_url_name = event_url_name
+        self.store = store or ResultsStore()
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.checkpoint_file = os.path.join(checkpoint_dir, f"{event_url_name}.json")
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.checkpoint = self._load_checkpoint()
+
+    # checkpoint ----
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_file) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            checkpoint = {}
+        checkpoint.setdefault("event", self.event_url_name)
+        checkpoint.setdefault("latest_run_number", None)
+        checkpoint.setdefault("no_results", [])
+        checkpoint.setdefault("failures", {})  # run number (str) : attempts
+        return checkpoint
+
+    def _save_checkpoint(self):
+        """Call holding self._lock"""
+        self.checkpoint["updated_at"] = time.time()
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.checkpoint_file), prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.checkpoint, f)
+            os.replace(tmp, self.checkpoint_file)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+
+    def stored_run_numbers(self) -> set:
+        stored = self.store.read_event_results(events=[self.event_url_name], columns=["run_number"])
+        if stored.empty:
+            return set()
+        return set(stored["run_number"].dropna().astype(int))
+
+    def pending_run_numbers(self, latest_run_number) -> list:
+        """Runs still to crawl - not stored, not known to have no results, not failed too often"""
+        skip = self.stored_run_numbers() | set(self.checkpoint["no_results"])
+        skip |= {int(n) for n, attempts in self.checkpoint["failures"].items() if attempts >= self.max_attempts}
+        return [n for n in range(1, latest_run_number + 1) if n not in skip]
+
+    # crawl ----
+    def _store_run(self, raw_results, run_number):
+        """Parse one scraped results page and store it - :return: number of finishers stored"""
+        page_run_number, run_date = Parkrun.parse_run_header(raw_results.text)
+        if run_date is None or page_run_number != run_number:
+            raise ValueError(f"Results page for run {run_number} has an unexpected header")
+        if not _TABLE.search(raw_results.text):
+            # no results table - e.g. a cancelled run
+            return 0
+        # any other parse error is a failure, retried on the next resume
+        results = Parkrun.collect_latest_results(raw_results)
+        self.store.write_event_results(self.event_url_name, run_date, results, run_number=run_number)
+        return len(results)
+
+    def _crawl_run(self, parkrun: Parkrun, run_number, latest_run_number):
+        if run_number == latest_run_number:
+            # already scraped
+            raw_results = parkrun.raw_latest_results
+        else:
+            raw_results = parkrun.scrape_results(run_number, priority=BACKGROUND)
+            raw_results.raise_for_status()
+        return self._store_run(raw_results, run_number)
+
+    def _record(self, run_number, n_results=None, error=None):
+        with self._lock:
+            failures = self.checkpoint["failures"]
+            if error is not None:
+                failures[str(run_number)] = failures.get(str(run_number), 0) + 1
+            else:
+                failures.pop(str(run_number), None)
+                if n_results == 0:
+                    self.checkpoint["no_results"].append(run_number)
+            self._save_checkpoint()
+
+    def run(self, stop: threading.Event = None) -> dict:
+        """
+        Crawl all pending runs - safe to call again after an interruption, or to pick up new runs
+        :param stop: threading.Event to stop early - runs in flight finish, the rest stay pending
+        :return: summary counts - crawled, no_results, failed, pending (left to crawl)
+        """
+        stop = stop or threading.Event()
+
+        # latest results page gives the latest run number - and is that run's results page too
+        parkrun = Parkrun(self.event_url_name, priority=BACKGROUND)
+        latest_run_number, _ = Parkrun.parse_run_header(parkrun.raw_latest_results.text)
+        if latest_run_number is None:
+            raise ValueError(f"Could not find the latest run number for {self.event_url_name}")
+        with self._lock:
+            self.checkpoint["latest_run_number"] = latest_run_number
+            self._save_checkpoint()
+
+        pending = self.pending_run_numbers(latest_run_number)
+        logger.info("%s: %d of %d runs to crawl", self.event_url_name, len(pending), latest_run_number)
+
+        summary = {"crawled": 0, "no_results": 0, "failed": 0}
+
+        def crawl(run_number):
+            if stop.is_set():
+                return None
+            return self._crawl_run(parkrun, run_number, latest_run_number)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="history-crawl") as executor:
+            futures = {executor.submit(crawl, n): n for n in pending}
+            try:
+                for future in as_completed(futures):
+                    run_number = futures[future]
+                    try:
+                        n_results = future.result()
+                    except Exception as e:
+                        logger.warning("%s run %d failed: %s", self.event_url_name, run_number, e)
+                        self._record(run_number, error=e)
+                        summary["failed"] += 1
+                        continue
+                    if n_results is None:  # stopped before it started
+                        continue
+                    self._record(run_number, n_results=n_results)
+                    summary["crawled" if n_results else "no_results"] += 1
+            except BaseException:
+                # e.g. KeyboardInterrupt - don't start any more runs, progress so far is checkpointed
+                stop.set()
+                raise
+
+        summary["pending"] = len(self.pending_run_numbers(latest_run_number))
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl an event's full results history into the results store")
+    parser.add_argument("events", nargs="+", help="event url names, e.g. theponds")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="max run pages crawled at once - default 4")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    for event_url_name in args.events:
+        summary = HistoryCrawler(event_url_name, max_concurrency=args.max_concurrency).run()
+        logger.info("%s: %s", event_url_name, summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,194 @@
 """Functions to fetch data"""
+import os
 import requests
-import json
+import threading
+import time
+from collections import deque, namedtuple
+
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from parkrun.response_cache import ResponseCache
+from parkrun.single_flight import SingleFlight
+from parkrun.rate_limit import HostRateLimiter, INTERACTIVE
+
+# shared http fetcher ---------------------------------
+FetchTiming = namedtuple(
+    "FetchTiming",
+    ["url", "status_code", "started", "elapsed_headers", "elapsed_total", "n_bytes", "priority", "queue_wait"],
+)
+
+
+class Fetcher:
+    """
+    Pooled, thread-safe HTTP fetcher shared by all scraping calls.
 
-from parkrun.constants import events_url
+    A single HTTPAdapter (and so a single urllib3 pool per host) is shared by every thread, so
+    keep-alive connections are reused across Flask worker threads. Each thread gets its own
+    requests.Session on top of the shared adapter, as sessions (cookies) are not thread-safe.
+
+    Requests are throttled per host by `rate_limiter` (if given) - time spent waiting for a slot is
+    recorded as queue_wait in timings().
+    """
 
-def scrape_url(url):
-    """Scrape target URL - return all"""
-    # proxies = { 
-    #     "http": 
-    # }
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate, br',
+        # only advertise encodings urllib3 can decode in place - 'br' needs brotli installed
+        'Accept-Encoding': ACCEPT_ENCODING,
         'Connection': 'keep-alive',
         'Upgrade-Insecure-Requests': '1',
     }
-    return(
-        requests.get(
-            url,
-            # proxies=proxies,
-            headers=headers
+
+    def __init__(self, pool_connections=10, pool_maxsize=32, timeout=(10, 60), n_timings=1000, rate_limiter=None):
+        """
+        :param pool_connections: number of per-host pools to keep
+        :param pool_maxsize: max keep-alive connections per host, across all threads
+        :param timeout: (connect, read) timeout in seconds for each request
+        :param n_timings: number of most recent request timings to keep
+        :param rate_limiter: HostRateLimiter shared by all processes - None for no throttling
+        """
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._pool_lock = threading.Lock()
+        self._pid = None
+        self._check_pid()
+        self._timings = deque(maxlen=n_timings)
+        self._timings_lock = threading.Lock()
+
+    def _check_pid(self):
+        """
+        Give this process its own connection pool and per-thread sessions - a forked child (e.g. a
+        background callback job) mustn't share the parent's pooled sockets
+        """
+        if self._pid == os.getpid():
+            return
+        with self._pool_lock:
+            if self._pid != os.getpid():
+                self._adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=False,
+                )
+                self._local = threading.local()
+                self._pid = os.getpid()
+
+    @property
+    def session(self) -> requests.Session:
+        """Session for the current thread, mounted on the shared connection pool"""
+        self._check_pid()
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url, headers=None, priority=INTERACTIVE) -> requests.Response:
+        """
+        GET url through the shared pool, recording timings on the response and the fetcher
+        :param priority: rate limiter lane - INTERACTIVE or BACKGROUND
+        """
+        lease = self.rate_limiter.acquire(url, priority) if self.rate_limiter is not None else None
+
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            # body is read (and gzip/br decoded) by requests on access - force it here so it's timed
+            n_bytes = len(response.content)
+        except requests.RequestException:
+            # connection errors / timeouts count against the host - repeated ones back it off
+            if lease is not None:
+                self.rate_limiter.release(lease, elapsed=time.perf_counter() - start, transport_error=True)
+            raise
+        except BaseException:
+            # e.g. KeyboardInterrupt - says nothing about the host, just free the slot
+            if lease is not None:
+                self.rate_limiter.release(lease)
+            raise
+        if lease is not None:
+            self.rate_limiter.release(
+                lease,
+                status_code=response.status_code,
+                elapsed=time.perf_counter() - start,
+                retry_after=response.headers.get("Retry-After"),
+            )
+
+        timing = FetchTiming(
+            url=url,
+            status_code=response.status_code,
+            started=started,
+            elapsed_headers=response.elapsed.total_seconds(),
+            elapsed_total=time.perf_counter() - start,
+            n_bytes=n_bytes,
+            priority=priority,
+            queue_wait=lease.queue_wait if lease is not None else 0.0,
         )
-    )
+        response.fetch_timing = timing
+        with self._timings_lock:
+            self._timings.append(timing)
+
+        return response
+
+    def timings(self) -> pd.DataFrame:
+        """Recent request timings, one row per request"""
+        with self._timings_lock:
+            timings = list(self._timings)
+        return pd.DataFrame(timings, columns=FetchTiming._fields)
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._adapter.close()
+
+
+fetcher = Fetcher(rate_limiter=HostRateLimiter())
+response_cache = ResponseCache()
+url_flight = SingleFlight("urls")
 
 
-def get_parkrun_locations():
-    """Scrape parkrun events json file from URL, then return df"""
+def scrape_url(url, use_cache=True, priority=INTERACTIVE):
+    """
+    Scrape target URL - return all
+    :param use_cache: serve from / store to the on-disk response cache. Stale entries are
+        revalidated with ETag / Last-Modified where the server provided them. Concurrent misses
+        for the same URL, across threads and worker processes, share a single fetch.
+    :param priority: rate limiter lane - INTERACTIVE (user lookups) or BACKGROUND (batch jobs)
+    """
+    if not use_cache:
+        return fetcher.get(url, priority=priority)
 
-    events_raw = scrape_url(events_url)
-    events_dict = json.loads(events_raw.text)
+    response = _fresh_cached_response(url)
+    if response is not None:
+        return response
+    # other processes wait on the leader's lock, then find its response in the cache
+    return url_flight.do(url, lambda: _fetch_to_cache(url, priority), recheck=lambda: _fresh_cached_response(url))
 
-    features = events_dict['events']['features']
-    return features
 
-    # parkrun_events = []
-    # for entry in features:
+def _fresh_cached_response(url):
+    cached = response_cache.get(url)
+    if cached is not None and response_cache.is_fresh(cached[0]):
+        return response_cache.to_response(*cached)
+    return None
 
-    #     df = pd.DataFrame({
-    #         "id": entry['id'],
-    #         "type": entry['type'],
-    #         "geometry_type": entry["geometry"]["type"],
-    #         "lat": entry["geometry"]["coordinates"][0],
-    #         "long": entry["geometry"]["coordinates"][1],
-    #     }, index = [0])
 
-    #     other_cols = pd.DataFrame(entry['properties'], index=[0])
+def _fetch_to_cache(url, priority):
+    cached = response_cache.get(url)
+    if cached is None:
+        response = fetcher.get(url, priority=priority)
+    else:
+        meta, body = cached
+        response = fetcher.get(url, headers=response_cache.validators(meta), priority=priority)
+        if response.status_code == 304:
+            response_cache.touch(url)
+            return response_cache.to_response(meta, body)
 
-    #     row = pd.concat([df, other_cols], axis=1)
-    #     parkrun_events.append(row)
+    if response.status_code == 200:
+        response_cache.set(url, response)
 
-    # return pd.concat(parkrun_events, axis=0)
\ No newline at end of file
+    return response
@@ -0,0 +1,140 @@
+"""Helpers to parse scraped parkrun pages into typed columns"""
+import re
+
+from lxml import etree
+import numpy as np
+import pandas as pd
+
+
+# base date that pd.to_datetime(format="%H:%M:%S") gives times of day
+TIME_BASE_DATE = pd.Timestamp("1900-01-01")
+
+
+def time_to_seconds(times: pd.Series) -> pd.Series:
+    """
+    Vectorised parse of finishing times - 'mm:ss' or 'h:mm:ss' - to integer seconds.
+    Missing times stay missing (nullable Int64).
+    """
+    parts = times.astype("string").str.split(":", expand=True)
+    if parts.shape[1] == 0 or (parts.shape[1] == 1 and parts[0].isna().all()):
+        # nothing to parse - e.g. no finishers, or none with a time
+        return pd.Series(pd.NA, index=times.index, dtype="Int64")
+    if parts.shape[1] not in (2, 3):
+        raise ValueError("Invalid time format")
+    parts = parts.apply(pd.to_numeric, errors="raise").astype("float")
+
+    if parts.shape[1] == 2:
+        seconds = parts[0] * 60 + parts[1]
+    else:
+        # rows without a third part are mm:ss, the others h:mm:ss
+        has_hours = parts[2].notna()
+        seconds = np.where(
+            has_hours,
+            parts[0] * 3600 + parts[1] * 60 + parts[2],
+            parts[0] * 60 + parts[1],
+        )
+        seconds = pd.Series(seconds, index=times.index)
+
+    return seconds.round().astype("Int64")
+
+
+def format_seconds(seconds) -> str:
+    """Seconds to a finishing time string - mm:ss, or h:mm:ss from an hour"""
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def seconds_to_datetime(seconds: pd.Series) -> pd.Series:
+    """Integer seconds to datetimes on TIME_BASE_DATE, for plotting times on a %M:%S axis"""
+    return TIME_BASE_DATE + pd.to_timedelta(seconds.astype("float"), unit="s")
+
+
+# athlete page ----------------------------------------
+ATHLETE_TABLES = ["summary_stats", "annual_bests", "all_results"]
+
+_NBR_PARKRUNS = re.compile(r"(\d[\d,]*)\s*parkruns total")
+_AGE_CATEGORY = re.compile(r"Most recent age category was ([^\n]*)")
+
+
+def _cell_text(cell):
+    """Stripped text of a table cell - blank cells are None (NaN), as in pd.read_html"""
+    # most cells are a bare text node - only walk descendants when there are child elements
+    text = cell.text if len(cell) == 0 else "".join(cell.itertext())
+    return (text or "").strip() or None
+
+
+def _typed_column(values):
+    """Column of cell strings to int / float array where every value parses, as pd.read_html does"""
+    try:
+        if None not in values:
+            return np.array(values, dtype="int64")
+        return np.array(["nan" if v is None else v for v in values], dtype="float64")
+    except (ValueError, TypeError):
+        pass
+    try:
+        return np.array(["nan" if v is None else v for v in values], dtype="float64")
+    except ValueError:
+        return values
+
+
+def _table_to_frame(table) -> pd.DataFrame:
+    """<table> element to DataFrame, typed like pd.read_html - numeric columns are parsed"""
+    columns = [
+        _cell_text(th) or f"Unnamed: {i}" for i, th in enumerate(table.iterfind("thead/tr/th"))
+    ]
+    rows = [[_cell_text(td) for td in tr.iterfind("td")] for tr in table.iterfind("tbody/tr")]
+    values = zip(*rows) if rows else [[] for _ in columns]
+
+    return pd.DataFrame(
+        {col: _typed_column(list(col_values)) for col, col_values in zip(columns, values)},
+        columns=columns,
+    )
+
+
+def parse_athlete_page(content: bytes, encoding="utf-8") -> dict:
+    """
+    Single pass over a parkrunner's /all results page - builds the HTML tree once and pulls out
+    the summary stats, annual bests and all results tables plus the header fields.
+    :param content: raw response body - bytes are decoded by lxml while parsing
+    :param encoding: encoding of content, e.g. response.encoding
+    :return: {"tables": {name: DataFrame}, "other_info": {athlete_name, nbr_parkruns, last_age_category}}
+    """
+    # plain etree parser - no lxml.html element class lookups, which dominate on big tables
+    tree = etree.fromstring(content, etree.HTMLParser(encoding=encoding))
+
+    tables = tree.findall(".//table")
+    if len(tables) < len(ATHLETE_TABLES):
+        raise ValueError("Parkrunner results tables not found on page")
+    scraped_tables = {
+        name: _table_to_frame(table) for name, table in zip(ATHLETE_TABLES, tables)
+    }
+
+    # athlete name is the text of the <h2> before the parkrun ID <span>
+    athlete_name = tree.find(".//h2").text.replace("\xa0", " ").strip()
+
+    nbr_parkruns = None
+    for h3 in tree.iterfind(".//h3"):
+        match = _NBR_PARKRUNS.search("".join(h3.itertext()))
+        if match:
+            nbr_parkruns = match.group(1)
+            break
+
+    last_age_category = None
+    for p in tree.iterfind(".//p"):
+        match = _AGE_CATEGORY.search("".join(p.itertext()))
+        if match:
+            last_age_category = match.group(1).strip()
+            break
+
+    if nbr_parkruns is None or last_age_category is None:
+        raise ValueError("Parkrunner header info not found on page")
+
+    return {
+        "tables": scraped_tables,
+        "other_info": {
+            "athlete_name": athlete_name,
+            "nbr_parkruns": nbr_parkruns,
+            "last_age_category": last_age_category,
+        },
+    }
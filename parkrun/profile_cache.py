@@ -0,0 +1,81 @@
+"""On-disk cache of parsed parkrunner profiles, e.g. pre-parsed by warm_cache.py"""
+import contextlib
+import os
+import re
+import struct
+import tempfile
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from parkrun.constants import cache_dir
+from parkrun.result_bundle import ParkrunnerResult
+
+_ATHLETE_ID = re.compile(r"\d+")
+
+# errors reading a truncated, corrupt or incompatible entry
+_CORRUPT_ENTRY = (ValueError, struct.error, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+class ProfileCache:
+    """
+    Parsed profiles (ParkrunnerResult bytes) keyed by athlete id, each with its own expiry.
+
+    Each entry is one file: expiry (unix time, f64) followed by the ParkrunnerResult bytes.
+    Writes go to a temp file and are renamed into place, so readers in other processes never
+    see a partial entry.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir, "profiles")
+        os.makedirs(self.path, exist_ok=True)
+
+    def _filename(self, athlete_id):
+        # ids become file names - only ever digits, so no path can escape the cache directory
+        if not _ATHLETE_ID.fullmatch(str(athlete_id)):
+            raise ValueError(f"Invalid athlete id: {athlete_id!r}")
+        return os.path.join(self.path, f"{athlete_id}.prkr")
+
+    def get(self, athlete_id):
+        """
+        :return: ParkrunnerResult, or None if missing or expired
+        :raises ValueError: athlete_id isn't a number
+        """
+        filename = self._filename(athlete_id)
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            (expires_at,) = struct.unpack_from("<d", data)
+            if time.time() >= expires_at:
+                return None
+            return ParkrunnerResult.from_bytes(data[8:])
+        except _CORRUPT_ENTRY:
+            # e.g. truncated, or written by an older format version - treat as a miss
+            return None
+
+    def set(self, result: ParkrunnerResult, expires_at):
+        filename = self._filename(result.athlete_id)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(struct.pack("<d", expires_at))
+                f.write(result.to_bytes())
+            os.replace(tmp, filename)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+
+    def delete(self, athlete_id):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._filename(athlete_id))
+
+
+profile_cache = ProfileCache()
@@ -0,0 +1,232 @@
+"""Per-host rate limiting of outbound requests, shared by all worker processes"""
+import contextlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from parkrun.constants import cache_dir
+
+# priority lanes
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+Lease = namedtuple("Lease", ["host", "lease_id", "priority", "queue_wait"])
+
+# connections opened by a parent process before fork - closing them in the child could release the
+# parent's locks, so they are kept open (and unused) for the life of the child
+_inherited_connections = []
+
+
+class RateLimitTimeout(Exception):
+    """No request slot for the host became free within max_wait"""
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host, with adaptive concurrency, in a SQLite database shared by all processes.
+
+    - each request takes a token - tokens refill at `rate` per second, up to `burst`
+    - at most `limit` requests per host are in flight at once. The limit grows by ~1 per `limit`
+      fast responses (additive increase), and is cut on 429 / 503 and on `max_errors` transport errors
+      (connection errors, timeouts) in a row - halved, with a pause for Retry-After or `backoff` seconds.
+      Responses slower than `slow_seconds`, and a single transport error, cut it by x 0.75 without a pause
+    - background requests only take a token while at least `background_reserve` more are left,
+      and stay below the limit by one slot, so interactive lookups go first
+    - in-flight requests are leases that expire after `lease_seconds`, so a crashed worker
+      can't hold its slots forever
+    """
+
+    def __init__(self, path=os.path.join(cache_dir, "rate_limit.sqlite"), rate=1.0, burst=5,
+                 initial_concurrency=2, max_concurrency=4, slow_seconds=5.0, backoff=30.0, max_errors=3,
+                 background_reserve=2, lease_seconds=120, poll_seconds=0.05):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.slow_seconds = slow_seconds
+        self.backoff = backoff
+        self.max_errors = max_errors
+        self.background_reserve = background_reserve
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # the database is opened on first use, not here - limiters are created at import time
+        self._local = threading.local()
+
+    # database ----
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """
+        Connection for the current thread and process - sqlite connections aren't shared across
+        threads, and mustn't be used in a child process forked after they were opened
+        """
+        db = getattr(self._local, "db", None)
+        if db is not None and self._local.pid != os.getpid():
+            # inherited across fork (e.g. a background callback job) - keep a reference so it's
+            # never closed in this process, and open a new one
+            _inherited_connections.append(db)
+            db = None
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._create_tables(db)
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    @staticmethod
+    def _create_tables(db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS hosts ("
+            "host TEXT PRIMARY KEY, tokens REAL, updated REAL, concurrency REAL, backoff_until REAL, "
+            "errors INTEGER DEFAULT 0)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS leases (id INTEGER PRIMARY KEY AUTOINCREMENT, host TEXT, expires REAL)"
+        )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        db = self._db
+        # IMMEDIATE - take the write lock up front, so read-modify-write of a bucket is atomic
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _host_state(self, db, host, now):
+        """:return: (tokens, concurrency, backoff_until, consecutive transport errors)"""
+        row = db.execute(
+            "SELECT tokens, updated, concurrency, backoff_until, errors FROM hosts WHERE host = ?", (host,)
+        ).fetchone()
+        if row is None:
+            return float(self.burst), float(self.initial_concurrency), 0.0, 0
+        tokens, updated, concurrency, backoff_until, errors = row
+        return min(self.burst, tokens + (now - updated) * self.rate), concurrency, backoff_until, errors or 0
+
+    def _save_host_state(self, db, host, now, tokens, concurrency, backoff_until, errors):
+        db.execute(
+            "INSERT OR REPLACE INTO hosts (host, tokens, updated, concurrency, backoff_until, errors) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (host, tokens, now, concurrency, backoff_until, errors),
+        )
+
+    # leases ----
+    def _try_acquire(self, host, priority):
+        """:return: (lease id, 0) if a request can start now, else (None, seconds to wait before retrying)"""
+        now = time.time()
+        with self._transaction() as db:
+            tokens, concurrency, backoff_until, errors = self._host_state(db, host, now)
+            db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+            (in_flight,) = db.execute("SELECT COUNT(*) FROM leases WHERE host = ?", (host,)).fetchone()
+
+            max_in_flight = max(1, math.floor(concurrency))
+            min_tokens = 1
+            if priority == BACKGROUND:
+                max_in_flight = max(1, max_in_flight - 1)
+                min_tokens += self.background_reserve
+
+            lease_id, wait = None, 0.0
+            if now < backoff_until:
+                wait = backoff_until - now
+            elif in_flight >= max_in_flight:
+                wait = self.poll_seconds
+            elif tokens < min_tokens:
+                wait = (min_tokens - tokens) / self.rate
+            else:
+                tokens -= 1
+                lease_id = db.execute(
+                    "INSERT INTO leases (host, expires) VALUES (?, ?)", (host, now + self.lease_seconds)
+                ).lastrowid
+
+            self._save_host_state(db, host, now, tokens, concurrency, backoff_until, errors)
+        return lease_id, wait
+
+    def acquire(self, url, priority=INTERACTIVE, max_wait=None) -> Lease:
+        """
+        Block until a request to url's host may start
+        :param priority: INTERACTIVE or BACKGROUND lane
+        :param max_wait: raise RateLimitTimeout after waiting this many seconds - None to wait indefinitely
+        :return: Lease - pass to release() once the response (or error) is in
+        """
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        while True:
+            lease_id, wait = self._try_acquire(host, priority)
+            waited = time.perf_counter() - start
+            if lease_id is not None:
+                return Lease(host=host, lease_id=lease_id, priority=priority, queue_wait=waited)
+            if max_wait is not None and waited + wait > max_wait:
+                raise RateLimitTimeout(f"No request slot for {host} within {max_wait}s")
+            # short sleeps - a slot can free up before the estimate, e.g. another request finishing
+            time.sleep(min(max(wait, self.poll_seconds), 1.0))
+
+    def release(self, lease: Lease, status_code=None, elapsed=None, retry_after=None, transport_error=False):
+        """
+        End a request, adapting the host's concurrency to how it went
+        :param status_code: the response's status - None with no response, e.g. the request was interrupted
+            or failed before reaching the host, which frees the slot without adapting anything
+        :param elapsed: seconds the request took
+        :param retry_after: the response's Retry-After header, if any
+        :param transport_error: the request failed talking to the host (connection error, timeout)
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("DELETE FROM leases WHERE id = ?", (lease.lease_id,))
+            tokens, concurrency, backoff_until, errors = self._host_state(db, lease.host, now)
+
+            if transport_error:
+                errors += 1
+                if errors >= self.max_errors:
+                    # host looks down - pause everyone, rather than keep retrying into it
+                    concurrency = max(1.0, concurrency / 2)
+                    backoff_until = max(backoff_until, now + self.backoff)
+                else:
+                    concurrency = max(1.0, concurrency * 0.75)
+            elif status_code is None:
+                pass
+            elif status_code in (429, 503):
+                errors = 0
+                concurrency = max(1.0, concurrency / 2)
+                backoff_until = max(backoff_until, now + self._retry_after_seconds(retry_after))
+            else:
+                errors = 0
+                if elapsed is not None and elapsed > self.slow_seconds:
+                    concurrency = max(1.0, concurrency * 0.75)
+                elif status_code < 500:
+                    concurrency = min(float(self.max_concurrency), concurrency + 1 / concurrency)
+
+            self._save_host_state(db, lease.host, now, tokens, concurrency, backoff_until, errors)
+
+    def _retry_after_seconds(self, retry_after) -> float:
+        try:
+            return min(float(retry_after), 10 * self.backoff)
+        except (TypeError, ValueError):
+            # missing, or an HTTP date - use the default pause
+            return self.backoff
+
+    def state(self) -> pd.DataFrame:
+        """Current bucket, concurrency limit and in-flight count per host"""
+        now = time.time()
+        db = self._db
+        hosts = db.execute("SELECT host FROM hosts").fetchall()
+        rows = []
+        for (host,) in hosts:
+            tokens, concurrency, backoff_until, errors = self._host_state(db, host, now)
+            (in_flight,) = db.execute(
+                "SELECT COUNT(*) FROM leases WHERE host = ? AND expires >= ?", (host, now)
+            ).fetchone()
+            rows.append((host, tokens, concurrency, in_flight, max(0.0, backoff_until - now), errors))
+        return pd.DataFrame(
+            rows, columns=["host", "tokens", "concurrency", "in_flight", "backoff_seconds", "errors"]
+        )
@@ -0,0 +1,217 @@
+"""On-disk cache of scraped responses, with per-URL TTLs and conditional revalidation"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import zstandard
+except ImportError:  # fall back to zlib if zstd isn't installed
+    zstandard = None
+
+# errors decompressing a truncated or corrupt body - ZstdError isn't a ValueError
+_CORRUPT_BODY = (ValueError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+from parkrun.constants import cache_dir
+
+
+# ttl policies -----------------------------------------
+def _next_saturday(now, hour):
+    """Next Saturday at `hour` strictly after `now` (local time)"""
+    days_ahead = (5 - now.weekday()) % 7
+    target = (now + datetime.timedelta(days=days_ahead)).replace(
+        hour=hour, minute=0, second=0, microsecond=0
+    )
+    if target <= now:
+        target += datetime.timedelta(days=7)
+    return target
+
+
+def _results_day_ttl(midweek_ttl, results_day_ttl, results_posted_hour=9):
+    """
+    TTL for pages that only change when parkrun results are posted (Saturday mornings).
+    Midweek, entries live for `midweek_ttl` seconds but never past the next results posting;
+    from Saturday morning until Sunday, entries only live for `results_day_ttl` seconds.
+    """
+
+    def ttl(now):
+        on_results_day = (now.weekday() == 5 and now.hour >= results_posted_hour) or (
+            now.weekday() == 6
+        )
+        if on_results_day:
+            return results_day_ttl
+        until_results = (_next_saturday(now, results_posted_hour) - now).total_seconds()
+        return min(midweek_ttl, until_results)
+
+    return ttl
+
+
+def next_results_posting(now=None, results_posted_hour=9) -> datetime.datetime:
+    """Next Saturday results posting after `now` (local time) - until then, posted results don't change"""
+    return _next_saturday(now or datetime.datetime.now(), results_posted_hour)
+
+
+# url pattern : ttl(now) -> seconds, first match wins
+TTL_POLICIES = [
+    (re.compile(r"/parkrunner/\d+/all"), _results_day_ttl(6 * 3600, 10 * 60)),
+    (re.compile(r"/results/latestresults"), _results_day_ttl(7 * 24 * 3600, 5 * 60)),
+    (re.compile(r"/results/\d+/?$"), lambda now: 30 * 24 * 3600),  # past results rarely change
+    (re.compile(r"events\.json$"), lambda now: 24 * 3600),
+]
+DEFAULT_TTL = 3600
+
+
+def ttl_for_url(url, now=None) -> float:
+    """Seconds a fresh response for `url` can be served without revalidation"""
+    now = now or datetime.datetime.now()
+    for pattern, ttl in TTL_POLICIES:
+        if pattern.search(url):
+            return ttl(now)
+    return DEFAULT_TTL
+
+
+# cache ------------------------------------------------
+class ResponseCache:
+    """
+    Persistent cache of response bodies keyed by URL.
+
+    Each entry is one file: a length-prefixed JSON header (status, headers, validators, expiry)
+    followed by the zstd (or zlib) compressed body. Writes go to a temp file and are renamed
+    into place, so concurrent readers never see a partial entry.
+    """
+
+    # headers that describe the wire encoding, not the decoded body we store
+    _drop_headers = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+    def __init__(self, path=None, compression_level=3):
+        self.path = path or os.path.join(cache_dir, "responses")
+        self.compression_level = compression_level
+
+    def _filename(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key[:2], key + ".cache")
+
+    def _compress(self, body):
+        if zstandard is not None:
+            return b"Z", zstandard.ZstdCompressor(level=self.compression_level).compress(body)
+        return b"D", zlib.compress(body, self.compression_level)
+
+    @staticmethod
+    def _decompress(codec, data):
+        if codec == b"Z":
+            if zstandard is None:
+                raise ValueError("Cache entry is zstd compressed but zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def _read(self, url):
+        """:return: (meta, codec, compressed body) for url, or None if not cached"""
+        filename = self._filename(url)
+        try:
+            with open(filename, "rb") as f:
+                (meta_len,) = struct.unpack("<I", f.read(4))
+                meta = json.loads(f.read(meta_len))
+                return meta, f.read(1), f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error):
+            # corrupt or unreadable entry - treat as a miss, it will be overwritten
+            return None
+
+    def get(self, url):
+        """:return: (meta, body) for url, or None if not cached"""
+        entry = self._read(url)
+        if entry is None:
+            return None
+        meta, codec, data = entry
+        try:
+            return meta, self._decompress(codec, data)
+        except _CORRUPT_BODY:
+            # e.g. truncated - treat as a miss, it will be overwritten
+            return None
+
+    def set(self, url, response: requests.Response, ttl=None):
+        """Store a 200 response for url, fresh for `ttl` seconds (default from TTL_POLICIES)"""
+        ttl = ttl_for_url(url) if ttl is None else ttl
+        meta = {
+            "url": url,
+            "status_code": response.status_code,
+            "encoding": response.encoding,
+            "headers": {
+                k: v for k, v in response.headers.items() if k.lower() not in self._drop_headers
+            },
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "expires_at": time.time() + ttl,
+        }
+        codec, body = self._compress(response.content)
+        self._write(url, meta, codec, body)
+        return meta
+
+    def touch(self, url, ttl=None):
+        """Extend the expiry of an entry after a successful (304) revalidation"""
+        ttl = ttl_for_url(url) if ttl is None else ttl
+        entry = self._read(url)
+        if entry is None:
+            return
+        meta, codec, data = entry
+        meta = dict(meta, fetched_at=time.time(), expires_at=time.time() + ttl)
+        # rewrite the header only - body is copied over still compressed
+        self._write(url, meta, codec, data)
+
+    def _write(self, url, meta, codec, body):
+        filename = self._filename(url)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        meta_bytes = json.dumps(meta).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(struct.pack("<I", len(meta_bytes)))
+                f.write(meta_bytes)
+                f.write(codec)
+                f.write(body)
+            os.replace(tmp, filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def delete(self, url):
+        try:
+            os.unlink(self._filename(url))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def is_fresh(meta, now=None):
+        return (now or time.time()) < meta["expires_at"]
+
+    @staticmethod
+    def validators(meta) -> dict:
+        """Conditional request headers for revalidating a stale entry"""
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    @staticmethod
+    def to_response(meta, body) -> requests.Response:
+        """Rebuild a requests.Response from a cache entry, so callers can't tell the difference"""
+        response = requests.Response()
+        response.status_code = meta["status_code"]
+        response.url = meta["url"]
+        response.encoding = meta["encoding"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response._content = body
+        response.from_cache = True
+        return response
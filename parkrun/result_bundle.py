@@ -0,0 +1,160 @@
+"""Compact, versioned binary format for parsed parkrunner results"""
+import json
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:  # fall back to zlib if zstd isn't installed
+    zstandard = None
+
+
+MAGIC = b"PRKR"
+FORMAT_VERSION = 1
+
+# all_results columns worth keeping - the rest (Time_numeric, Time_datetime, ...) are derived on load
+ALL_RESULTS_COLUMNS = [
+    "Event",
+    "Run Date",
+    "Run Number",
+    "Position",
+    "Time",
+    "Age Grade",
+    "PB?",
+    "Row_key",
+    "Row_hash",
+    "Time_seconds",
+    "Parkrun Number",
+    "Is_PB",
+]
+
+
+# column codecs ---------------------------------------
+def _encode_column(series: pd.Series):
+    """:return: (column spec, list of buffers)"""
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and series.dtype.kind in "iufb":
+        # nullable numeric - values + mask
+        values = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+        mask = series.isna().to_numpy()
+        return {"kind": "masked", "dtype": str(series.dtype), "numpy_dtype": values.dtype.str}, [
+            values.tobytes(), np.packbits(mask).tobytes()
+        ]
+    if series.dtype.kind == "M":
+        values = series.to_numpy(dtype="datetime64[ns]")
+        return {"kind": "datetime", "dtype": "datetime64[ns]"}, [values.view("int64").tobytes()]
+    if series.dtype.kind in "iufb":
+        values = np.ascontiguousarray(series.to_numpy())
+        return {"kind": "numpy", "dtype": values.dtype.str}, [values.tobytes()]
+    # strings / objects - json list, None for missing
+    values = [None if pd.isna(v) else str(v) for v in series]
+    return {"kind": "json"}, [json.dumps(values, ensure_ascii=False).encode("utf-8")]
+
+
+def _decode_column(spec, buffers, n_rows):
+    """:return: array-like for one column - numpy arrays are copied out of the read-only buffer"""
+    kind = spec["kind"]
+    if kind == "masked":
+        values = np.frombuffer(buffers[0], dtype=spec["numpy_dtype"]).copy()
+        mask = np.unpackbits(np.frombuffer(buffers[1], dtype="uint8"))[:n_rows].astype(bool)
+        array_type = pd.api.types.pandas_dtype(spec["dtype"]).construct_array_type()
+        return array_type(values, mask)
+    if kind == "datetime":
+        return np.frombuffer(buffers[0], dtype="int64").view("datetime64[ns]").copy()
+    if kind == "numpy":
+        return np.frombuffer(buffers[0], dtype=spec["dtype"]).copy()
+    return np.array(json.loads(buffers[0]), dtype="object")
+
+
+def _encode_frame(df: pd.DataFrame):
+    columns, buffers = [], []
+    for col in df.columns:
+        spec, col_buffers = _encode_column(df[col])
+        spec["name"] = col
+        spec["n_buffers"] = len(col_buffers)
+        columns.append(spec)
+        buffers.extend(col_buffers)
+    return {"n_rows": len(df), "columns": columns}, buffers
+
+
+def _decode_frame(spec, buffers) -> pd.DataFrame:
+    data = {}
+    for col in spec["columns"]:
+        col_buffers = [next(buffers) for _ in range(col["n_buffers"])]
+        data[col["name"]] = _decode_column(col, col_buffers, spec["n_rows"])
+    return pd.DataFrame(data, columns=[c["name"] for c in spec["columns"]])
+
+
+# result type -----------------------------------------
+class ParkrunnerResult:
+    """
+    Slim bundle of a parkrunner's parsed results - header info and parsed columns only, no raw
+    page and no derived tables. Pickles through its own binary format:
+
+        MAGIC | version (u8) | codec (1 byte) | header length (u32) | JSON header | compressed buffers
+    """
+
+    __slots__ = ("athlete_id", "other_info", "summary_stats", "annual_bests", "all_results")
+
+    def __init__(self, athlete_id, other_info, summary_stats, annual_bests, all_results):
+        self.athlete_id = athlete_id
+        self.other_info = other_info
+        self.summary_stats = summary_stats
+        self.annual_bests = annual_bests
+        self.all_results = all_results
+
+    def to_bytes(self) -> bytes:
+        header = {"athlete_id": self.athlete_id, "other_info": self.other_info, "tables": {}}
+        buffers = []
+        for name in ["summary_stats", "annual_bests", "all_results"]:
+            header["tables"][name], table_buffers = _encode_frame(getattr(self, name))
+            buffers.extend(table_buffers)
+        header["buffer_lengths"] = [len(b) for b in buffers]
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        payload = b"".join(buffers)
+        if zstandard is not None:
+            codec, payload = b"Z", zstandard.ZstdCompressor(level=3).compress(payload)
+        else:
+            codec, payload = b"D", zlib.compress(payload, 6)
+
+        return b"".join([
+            MAGIC,
+            struct.pack("<B", FORMAT_VERSION),
+            codec,
+            struct.pack("<I", len(header_bytes)),
+            header_bytes,
+            payload,
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ParkrunnerResult":
+        if data[:4] != MAGIC:
+            raise ValueError("Not a ParkrunnerResult")
+        (version,) = struct.unpack_from("<B", data, 4)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported ParkrunnerResult format version {version}")
+        codec = data[5:6]
+        (header_len,) = struct.unpack_from("<I", data, 6)
+        header = json.loads(data[10:10 + header_len])
+        payload = data[10 + header_len:]
+        if codec == b"Z":
+            if zstandard is None:
+                raise ValueError("ParkrunnerResult is zstd compressed but zstandard is not installed")
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        else:
+            payload = zlib.decompress(payload)
+
+        offsets = np.cumsum([0] + header["buffer_lengths"])
+        buffers = iter(
+            payload[start:end] for start, end in zip(offsets[:-1], offsets[1:])
+        )
+        tables = {
+            name: _decode_frame(spec, buffers) for name, spec in header["tables"].items()
+        }
+        return cls(athlete_id=header["athlete_id"], other_info=header["other_info"], **tables)
+
+    def __reduce__(self):
+        return (ParkrunnerResult.from_bytes, (self.to_bytes(),))
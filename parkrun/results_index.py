@@ -0,0 +1,61 @@
+"""Index over a parkrunner's results for fast event / date / PB filtering"""
+import numpy as np
+import pandas as pd
+
+
+class ResultsIndex:
+    """
+    Built once per all_results table:
+    - positions of all runs in date order, and of each event's runs in date order
+    - running PB flags over all runs and within each event
+    - sorted run dates for each of those, so date windows are a searchsorted
+    Any combination of filters is then slicing / masking of small arrays - no full-table passes.
+    """
+
+    def __init__(self, all_results: pd.DataFrame):
+        self.all_results = all_results
+
+        order = np.argsort(all_results["Run Date"].to_numpy(), kind="stable")
+        ordered = all_results.iloc[order]
+        dates = ordered["Run Date"].to_numpy(dtype="datetime64[ns]")
+        times = ordered["Time_seconds"].astype("float")
+
+        self.positions = order
+        self.dates = dates
+        self.is_pb = (times == times.cummin()).to_numpy()
+
+        # per event - groupby keeps date order within each group
+        event_pb = (times == times.groupby(ordered["Event"].to_numpy()).cummin()).to_numpy()
+        self.event_positions = {}
+        self.event_dates = {}
+        self.event_is_pb = {}
+        for event, idx in ordered.groupby("Event", sort=False).indices.items():
+            self.event_positions[event] = order[idx]
+            self.event_dates[event] = dates[idx]
+            self.event_is_pb[event] = event_pb[idx]
+
+    def select(self, event=None, start=None, end=None, pb_only=False, last_n=None):
+        """
+        :param event: only runs at this event - PBs are then PBs for that event
+        :param start, end: inclusive Run Date window - None for unbounded
+        :param pb_only: only runs that were a (running) PB at the time
+        :param last_n: only the most recent n runs after the other filters
+        :return: (positions into all_results in date order, PB flag for each)
+        """
+        if event is not None:
+            positions = self.event_positions.get(event, np.array([], dtype="int64"))
+            dates = self.event_dates.get(event, np.array([], dtype="datetime64[ns]"))
+            is_pb = self.event_is_pb.get(event, np.array([], dtype="bool"))
+        else:
+            positions, dates, is_pb = self.positions, self.dates, self.is_pb
+
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start), "ns"), "left")
+        hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end), "ns"), "right")
+        positions, is_pb = positions[lo:hi], is_pb[lo:hi]
+
+        if pb_only:
+            positions, is_pb = positions[is_pb], is_pb[is_pb]
+        if last_n:
+            positions, is_pb = positions[-last_n:], is_pb[-last_n:]
+
+        return positions, is_pb
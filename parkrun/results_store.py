@@ -0,0 +1,167 @@
+"""Persistent columnar (Parquet) store of parsed athlete and event results"""
+import os
+import tempfile
+import zlib
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:  # optional - only needed to persist results
+    pa = None
+
+from parkrun.constants import cache_dir
+
+# athlete files are written with this schema whatever a page's columns were parsed as (e.g. a column
+# with no values at all parses as float), so every file in the dataset reads the same way
+ATHLETE_SCHEMA = pa.schema(
+    [
+        ("Event", pa.string()),
+        ("Run Date", pa.timestamp("ns")),
+        ("Run Number", pa.int64()),
+        ("Position", pa.int64()),
+        ("Time", pa.string()),
+        ("Age Grade", pa.string()),
+        ("PB?", pa.string()),
+        ("Row_key", pa.uint64()),
+        ("Row_hash", pa.uint64()),
+        ("Time_seconds", pa.int64()),
+        ("Parkrun Number", pa.int64()),
+        ("Is_PB", pa.bool_()),
+        ("athlete_id", pa.string()),
+    ]
+) if pa is not None else None
+
+
+class ResultsStore:
+    """
+    Parquet datasets of parsed results, shared across sessions and worker processes.
+
+    Layout under `path`:
+        athletes/bucket=NN/{athlete_id}.parquet      - Parkrunner all_results, one file per athlete
+        events/event={url name}/run_date=YYYY-MM-DD/part-0.parquet - Parkrun results, one file per run
+
+    Files are written to a temp file and renamed into place. Reads go through pyarrow datasets on a
+    memory-mapped local filesystem, and only load the requested columns and matching partitions.
+    """
+
+    def __init__(self, path=None, n_athlete_buckets=64):
+        if pa is None:
+            raise ImportError("ResultsStore requires pyarrow - pip install pyarrow")
+        self.path = path or os.path.join(cache_dir, "results")
+        self.n_athlete_buckets = n_athlete_buckets
+        self._fs = pafs.LocalFileSystem(use_mmap=True)
+
+    # athletes ----
+    def _athlete_bucket(self, athlete_id) -> int:
+        # crc32 rather than hash() - stable across processes
+        return zlib.crc32(str(athlete_id).encode()) % self.n_athlete_buckets
+
+    def _athlete_file(self, athlete_id):
+        return os.path.join(
+            self.path, "athletes", f"bucket={self._athlete_bucket(athlete_id):02d}", f"{athlete_id}.parquet"
+        )
+
+    def write_athlete_results(self, athlete_id, all_results: pd.DataFrame):
+        """Store (replace) an athlete's parsed all_results table - columns outside ATHLETE_SCHEMA are dropped"""
+        df = all_results.assign(athlete_id=str(athlete_id)).reindex(columns=ATHLETE_SCHEMA.names)
+        table = pa.Table.from_pandas(df, schema=ATHLETE_SCHEMA, preserve_index=False)
+        self._write(table, self._athlete_file(athlete_id))
+
+    def has_athlete(self, athlete_id) -> bool:
+        return os.path.exists(self._athlete_file(athlete_id))
+
+    def read_athlete_results(self, athlete_ids=None, columns=None, filter=None) -> pd.DataFrame:
+        """
+        :param athlete_ids: athlete ids to load - None for all stored athletes
+        :param columns: columns to load - None for all
+        :param filter: extra pyarrow.dataset expression on rows, e.g. ds.field("Event") == "The Ponds"
+        :return: Matching rows of stored all_results, with an athlete_id column
+        """
+        root = os.path.join(self.path, "athletes")
+        if athlete_ids is not None:
+            # only open the athletes' own files - no directory scan
+            files = [self._athlete_file(a) for a in athlete_ids]
+            files = [f for f in files if os.path.exists(f)]
+            if not files:
+                return pd.DataFrame(columns=columns)
+            dataset = ds.dataset(files, format="parquet", schema=ATHLETE_SCHEMA, filesystem=self._fs)
+        elif os.path.isdir(root):
+            # explicit schema - not inferred from whichever file comes first
+            dataset = ds.dataset(root, format="parquet", schema=ATHLETE_SCHEMA, filesystem=self._fs)
+        else:
+            return pd.DataFrame(columns=columns)
+
+        return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+    # events ----
+    def _event_dir(self, event_url_name, run_date):
+        return os.path.join(
+            self.path, "events", f"event={event_url_name}", f"run_date={pd.Timestamp(run_date).date()}"
+        )
+
+    def write_event_results(self, event_url_name, run_date, results: pd.DataFrame, run_number=None):
+        """Store (replace) the results of one run of an event"""
+        df = results.assign(run_number=run_number) if run_number is not None else results
+        self._write(
+            pa.Table.from_pandas(df, preserve_index=False),
+            os.path.join(self._event_dir(event_url_name, run_date), "part-0.parquet"),
+        )
+
+    def has_event_results(self, event_url_name, run_date) -> bool:
+        return os.path.exists(os.path.join(self._event_dir(event_url_name, run_date), "part-0.parquet"))
+
+    def read_event_results(self, events=None, start=None, end=None, columns=None, filter=None) -> pd.DataFrame:
+        """
+        :param events: event url names to load - None for all
+        :param start, end: inclusive run date range - None for unbounded
+        :param columns: columns to load - None for all (event and run_date included)
+        :param filter: extra pyarrow.dataset expression on rows
+        :return: Matching rows of stored event results, with event and run_date columns
+        """
+        root = os.path.join(self.path, "events")
+        if not os.path.isdir(root):
+            return pd.DataFrame(columns=columns)
+
+        dataset = ds.dataset(
+            root,
+            format="parquet",
+            filesystem=self._fs,
+            partitioning=ds.partitioning(
+                pa.schema([("event", pa.string()), ("run_date", pa.date32())]), flavor="hive"
+            ),
+        )
+
+        # partition filters prune whole directories before any file is opened
+        expr = None
+        for condition in [
+            ds.field("event").isin(list(events)) if events is not None else None,
+            ds.field("run_date") >= pd.Timestamp(start).date() if start is not None else None,
+            ds.field("run_date") <= pd.Timestamp(end).date() if end is not None else None,
+            filter,
+        ]:
+            if condition is not None:
+                expr = condition if expr is None else expr & condition
+
+        return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+    # helpers ----
+    @staticmethod
+    def _write(table, filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # dot prefix - half-written files are ignored by dataset discovery
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=".", suffix=".tmp")
+        os.close(fd)
+        try:
+            pq.write_table(table, tmp, compression="zstd")
+            os.replace(tmp, filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+# None without pyarrow - parsed results are then not persisted
+results_store = ResultsStore() if pa is not None else None
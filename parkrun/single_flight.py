@@ -0,0 +1,170 @@
+"""Coalescing of concurrent identical work (e.g. fetching the same URL or profile) across threads and processes"""
+import contextlib
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows - coalesce within this process only
+    fcntl = None
+
+from parkrun.constants import cache_dir
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs work once per key while it is in flight:
+
+    - threads in this process - the first caller for a key (the leader) runs fn, later callers wait
+      for it and get the leader's result (or exception)
+    - other processes - leaders hold an exclusive lock file for the key while running fn, so another
+      process's leader waits, then calls recheck() - which should find the first leader's result,
+      e.g. a fresh cache entry or a result shared with share() - before falling back to running fn
+
+    Each key has its own lock file, so unrelated keys never wait on each other. Lock and result files
+    unused for `result_ttl` seconds are removed as leaders finish, so the lock directory stays bounded.
+    """
+
+    def __init__(self, name, lock_dir=os.path.join(cache_dir, "single-flight"), result_ttl=60):
+        self.name = name
+        self.lock_dir = os.path.join(lock_dir, name)
+        self.result_ttl = result_ttl
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._next_expire = 0.0
+
+    def _digest(self, key) -> str:
+        return hashlib.sha1(str(key).encode()).hexdigest()
+
+    @contextlib.contextmanager
+    def _file_lock(self, key):
+        if fcntl is None:
+            yield
+            return
+        filename = os.path.join(self.lock_dir, self._digest(key) + ".lock")
+        while True:
+            lock_file = open(filename, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # _expire may have removed the file while we waited - then lock the one replacing it
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(filename).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                lock_file.close()
+                raise
+            lock_file.close()
+
+        try:
+            yield
+        finally:
+            # mark as recently used, so _expire leaves it
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(filename)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def do(self, key, fn, recheck=None):
+        """
+        :param fn: does the work - called at most once at a time per key, across threads and processes
+        :param recheck: optional - returns the result if another process has just produced it, else None
+        :return: result of fn (or recheck) - shared by all callers waiting on the same key in this process
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._file_lock(key):
+                result = recheck() if recheck is not None else None
+                if result is None:
+                    result = fn()
+            call.result = result
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if time.time() >= self._next_expire:
+                self._expire()
+
+    # results shared across processes ----
+    def _result_file(self, key):
+        return os.path.join(self.lock_dir, self._digest(key) + ".result")
+
+    def share(self, key, data: bytes):
+        """Publish a leader's (serialised) result for other processes' recheck, for `result_ttl` seconds"""
+        filename = self._result_file(key)
+        fd, tmp = tempfile.mkstemp(dir=self.lock_dir, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, filename)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+
+    def shared(self, key):
+        """:return: bytes published with share() in the last `result_ttl` seconds, else None"""
+        filename = self._result_file(key)
+        try:
+            if time.time() - os.path.getmtime(filename) > self.result_ttl:
+                return None
+            with open(filename, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _expire(self):
+        """Remove result and lock files unused for `result_ttl` seconds"""
+        now = time.time()
+        self._next_expire = now + self.result_ttl
+        for entry in os.scandir(self.lock_dir):
+            with contextlib.suppress(FileNotFoundError):
+                if now - entry.stat().st_mtime <= self.result_ttl:
+                    continue
+                if entry.name.endswith(".result"):
+                    os.unlink(entry.path)
+                elif entry.name.endswith(".lock"):
+                    self._remove_lock_file(entry.path)
+
+    @staticmethod
+    def _remove_lock_file(filename):
+        """Unlink a lock file, only if no one holds or waits on it - waiters re-check after locking"""
+        fd = os.open(filename, os.O_WRONLY)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            if os.fstat(fd).st_ino == os.stat(filename).st_ino:
+                os.unlink(filename)
+        finally:
+            os.close(fd)
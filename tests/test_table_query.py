@@ -0,0 +1,133 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dash_app.parkrunner_app.table_query import _FilterParser, _tokenize, _typed_key, query_table
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "Parkrun Number": [1, 2, 3, 4, 5],
+            "Event": ["The Ponds", "Curl Curl", "Rhodes", "Curl Curl", "St Peters"],
+            "Run Date": [datetime.date(2022, 1, 1), datetime.date(2022, 6, 4), datetime.date(2023, 1, 7),
+                         datetime.date(2023, 5, 6), datetime.date(2023, 9, 2)],
+            "Position": [12, 40, 7, 55, 23],
+            "Time": ["21:30", "24:05", "19:58", "1:02:13", "22:47"],
+            "PB": [np.nan, np.nan, "⭐", np.nan, np.nan],
+            "Age Grade": ["55.10%", "49.20%", "60.35%", "30.00%", "52.00%"],
+        }
+    )
+
+
+def matching(df, query):
+    """:return: Parkrun Numbers of rows matching the filter query"""
+    return df["Parkrun Number"][_FilterParser(df, df.apply(_typed_key), query).parse()].tolist()
+
+
+def test_tokenize_records_spans():
+    assert _tokenize('{Event} contains "Curl"') == [
+        ("column", "{Event}", 0, 7),
+        ("binary", "contains", 8, 16),
+        ("string", '"Curl"', 17, 23),
+    ]
+
+
+def test_empty_query_matches_all(df):
+    assert matching(df, "") == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("{Position} < 20", [1, 3]),
+        ("{Position} lt 20", [1, 3]),
+        ("{Position} <= 23", [1, 3, 5]),
+        ("{Position} > 40", [4]),
+        ("{Position} ge 40", [2, 4]),
+        ("{Position} = 7", [3]),
+        ("{Position} eq 7", [3]),
+        ("{Position} != 7", [1, 2, 4, 5]),
+        ("{Event} = Rhodes", [3]),
+        ("{Event} contains Ponds", [1]),
+        ("{Event} icontains ponds", [1]),
+        ("{Event} scontains ponds", []),
+        ("{Run Date} datestartswith 2023", [3, 4, 5]),
+        ("{Run Date} > 2023-01-01", [3, 4, 5]),
+        ("{PB} is blank", [1, 2, 4, 5]),
+        ("!{PB} is blank", [3]),
+    ],
+)
+def test_operators(df, query, expected):
+    assert matching(df, query) == expected
+
+
+def test_typed_comparisons(df):
+    # times and age grades compare as numbers, not text
+    assert matching(df, "{Time} > 23:00") == [2, 4]
+    assert matching(df, "{Age Grade} >= 52%") == [1, 3, 5]
+
+
+@pytest.mark.parametrize(
+    "query",
+    ['{Event} contains "Curl Curl"', "{Event} contains 'Curl Curl'", "{Event} contains `Curl Curl`"],
+)
+def test_quoted_values(df, query):
+    assert matching(df, query) == [2, 4]
+
+
+def test_escapes_in_quoted_values():
+    df = pd.DataFrame({"Parkrun Number": [1, 2], "Event": ['Say "hi"', "Say hi"]})
+    assert matching(df, r'{Event} = "Say \"hi\""') == [1]
+
+
+def test_unquoted_multi_word_value(df):
+    assert matching(df, "{Event} contains Curl Curl") == [2, 4]
+    assert matching(df, "{Event} = The Ponds") == [1]
+    # value stops at the logical operator
+    assert matching(df, "{Event} contains Curl Curl && {Position} < 50") == [2]
+
+
+def test_and_binds_tighter_than_or(df):
+    # 1 || (4 && 3) - not (1 || 4) && 3
+    assert matching(df, "{Parkrun Number} = 1 || {Parkrun Number} = 4 && {Parkrun Number} = 3") == [1]
+    assert matching(df, "{Parkrun Number} = 1 or {Parkrun Number} = 4 and {Parkrun Number} = 3") == [1]
+
+
+def test_parentheses_override_precedence(df):
+    assert matching(df, "({Parkrun Number} = 1 || {Parkrun Number} = 4) && {Parkrun Number} = 3") == []
+    assert matching(df, "({Event} contains Curl || {Event} = Rhodes) && {Position} < 50") == [2, 3]
+
+
+def test_not_applies_to_group(df):
+    assert matching(df, "!({Event} contains Curl || {Position} > 20)") == [1, 3]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "{Event}",
+        "{Event} contains",
+        "{Nope} = 1",
+        "({Position} < 20",
+        "{Position} < 20)",
+        "contains Curl",
+        "{Position} < 20 &&",
+    ],
+)
+def test_invalid_queries(df, query):
+    with pytest.raises(ValueError):
+        matching(df, query)
+
+
+def test_query_table_filters_sorts_and_pages(df):
+    records, page_count = query_table(
+        df, page_current=0, page_size=2, sort_by=[{"column_id": "Time", "direction": "desc"}],
+        filter_query="{Position} < 50",
+    )
+    assert page_count == 2
+    # Time sorts on seconds - 24:05 before 22:47
+    assert [r["Parkrun Number"] for r in records] == [2, 5]
@@ -0,0 +1,197 @@
+"""
+Cache warming entry point - pre-fetches and pre-parses a watchlist of parkrunners and events once
+Saturday's results are likely posted, so the app serves them warm during the afternoon peak.
+
+Watchlist is a JSON file:
+    {"athletes": [7417035, ...], "events": ["theponds", ...]}
+
+Usage:
+    python warm_cache.py watchlist.json            # daemon - warm every Saturday from --start-hour
+    python warm_cache.py watchlist.json --now      # warm once, now
+
+Pages fetched before their results are posted aren't pinned - they are retried every --retry-every
+minutes, for up to --retry-for hours, until they are.
+"""
+import argparse
+import datetime
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from parkrun.Parkrun import Parkrun
+from parkrun.Parkrunner import Parkrunner
+from parkrun.load_data import response_cache
+from parkrun.profile_cache import profile_cache
+from parkrun.rate_limit import BACKGROUND
+from parkrun.response_cache import next_results_posting, ttl_for_url
+
+logger = logging.getLogger("warm_cache")
+
+
+def load_watchlist(path) -> dict:
+    with open(path) as f:
+        watchlist = json.load(f)
+    return {
+        "athletes": [str(a) for a in watchlist.get("athletes", [])],
+        "events": [str(e) for e in watchlist.get("events", [])],
+    }
+
+
+def warmed_until(max_age):
+    """Warmed data is served until the next results posting, or for at most max_age seconds"""
+    return min(next_results_posting().timestamp(), time.time() + max_age)
+
+
+def has_latest_results(run_date) -> bool:
+    """Whether run_date is on or after the latest results posting - i.e. the results can't change until the next"""
+    latest_posting = next_results_posting() - datetime.timedelta(days=7)
+    return run_date is not None and not pd.isna(run_date) and run_date.date() >= latest_posting.date()
+
+
+def warm_athlete(athlete_id, max_age) -> bool:
+    """:return: whether the profile was pinned until the next results posting"""
+    parkrunner = Parkrunner(athlete_id)
+    parkrunner.fetch_data(priority=BACKGROUND)
+    pinned = has_latest_results(parkrunner.tables["all_results"]["Run Date"].max())
+    # without this week's run, results may not be posted yet - keep the usual results-day TTL
+    expires_at = warmed_until(max_age) if pinned else time.time() + ttl_for_url(parkrunner.athlete_url)
+    profile_cache.set(parkrunner.to_result(), expires_at=expires_at)
+    return pinned
+
+
+def warm_event(event_url_name, max_age) -> bool:
+    """:return: whether the latest results page was pinned until the next results posting"""
+    parkrun = Parkrun(event_url_name, priority=BACKGROUND)
+    parkrun.latest_results  # scrape and parse
+    _, run_date = Parkrun.parse_run_header(parkrun.raw_latest_results.text)
+    if not has_latest_results(run_date):
+        # still last week's results - leave the page on the results-day TTL of minutes
+        return False
+    # keep the scraped page fresh in the response cache, rather than the results-day TTL of minutes
+    response_cache.touch(parkrun.latest_results_url, ttl=warmed_until(max_age) - time.time())
+    return True
+
+
+def warm(watchlist, window=0.0, concurrency=4, max_age=24 * 3600, stop=None):
+    """
+    Warm every athlete and event in the watchlist, spreading start times evenly over `window` seconds
+    :param concurrency: max number of pages fetched / parsed at once
+    :param stop: threading.Event to abandon warming early
+    :return: (number warmed, list of (kind, id, exception) failures,
+              watchlist of the pages fetched without this week's results - not pinned)
+    """
+    stop = stop or threading.Event()
+    jobs = [("athlete", a, warm_athlete) for a in watchlist["athletes"]] + [
+        ("event", e, warm_event) for e in watchlist["events"]
+    ]
+    interval = window / len(jobs) if jobs else 0
+    start = time.monotonic()
+    failures = []
+    unpinned = {"athletes": [], "events": []}
+
+    def run(i, kind, key, warm_one):
+        # spread start times over the window - stop.wait returns early if stopped
+        if stop.wait(max(0.0, start + i * interval - time.monotonic())):
+            return
+        try:
+            if warm_one(key, max_age):
+                logger.info("Warmed %s %s", kind, key)
+            else:
+                logger.info("Fetched %s %s - this week's results not found, not pinned", kind, key)
+                unpinned[kind + "s"].append(key)
+        except Exception as e:
+            logger.warning("Failed to warm %s %s: %s", kind, key, e)
+            failures.append((kind, key, e))
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="warm-cache") as executor:
+        for i, (kind, key, warm_one) in enumerate(jobs):
+            executor.submit(run, i, kind, key, warm_one)
+
+    n_unpinned = len(unpinned["athletes"]) + len(unpinned["events"])
+    return len(jobs) - len(failures) - n_unpinned, failures, unpinned
+
+
+def warm_until_pinned(watchlist, retry_every=600, retry_until=None, stop=None, **warm_kwargs):
+    """
+    warm() the watchlist, then re-warm pages whose results weren't posted yet every `retry_every`
+    seconds until they are pinned, or until `retry_until` (unix time)
+    :return: (number warmed, list of (kind, id, exception) failures, watchlist still not pinned)
+    """
+    stop = stop or threading.Event()
+    n_warmed, failures, unpinned = warm(watchlist, stop=stop, **warm_kwargs)
+    warm_kwargs.pop("window", None)  # retries are few - no need to spread them
+
+    while unpinned["athletes"] or unpinned["events"]:
+        if retry_until is None or time.time() + retry_every > retry_until:
+            break
+        logger.info(
+            "Retrying %d athletes and %d events without this week's results in %d minutes",
+            len(unpinned["athletes"]), len(unpinned["events"]), retry_every // 60,
+        )
+        if stop.wait(retry_every):
+            break
+        n_retried, retry_failures, unpinned = warm(unpinned, stop=stop, **warm_kwargs)
+        n_warmed += n_retried
+        failures += retry_failures
+
+    return n_warmed, failures, unpinned
+
+
+def next_warm_start(start_hour, now=None) -> datetime.datetime:
+    """Next Saturday at start_hour (local time) - when results are likely posted"""
+    return next_results_posting(now, results_posted_hour=start_hour)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("watchlist", help="JSON file with athlete ids and event url names to warm")
+    parser.add_argument("--now", action="store_true", help="warm once straight away, then exit")
+    parser.add_argument("--start-hour", type=int, default=12,
+                        help="hour on Saturday (local time) results are likely posted by - default 12")
+    parser.add_argument("--window", type=float, default=None,
+                        help="minutes to spread warming over - default 120 (0 with --now)")
+    parser.add_argument("--concurrency", type=int, default=4, help="max pages warmed at once - default 4")
+    parser.add_argument("--max-age", type=float, default=24,
+                        help="hours warmed data is served for, at most - default 24")
+    parser.add_argument("--retry-every", type=float, default=10,
+                        help="minutes between retries of pages without this week's results - default 10")
+    parser.add_argument("--retry-for", type=float, default=None,
+                        help="hours to keep retrying them for - default 6 (0 with --now)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    while True:
+        if not args.now:
+            start_at = next_warm_start(args.start_hour)
+            logger.info("Next warm at %s", start_at)
+            time.sleep(max(0.0, (start_at - datetime.datetime.now()).total_seconds()))
+
+        # re-read each run, so the watchlist can be edited while the daemon is running
+        watchlist = load_watchlist(args.watchlist)
+        window = args.window if args.window is not None else (0 if args.now else 120)
+        retry_for = args.retry_for if args.retry_for is not None else (0 if args.now else 6)
+        n_warmed, failures, unpinned = warm_until_pinned(
+            watchlist,
+            retry_every=args.retry_every * 60,
+            retry_until=time.time() + retry_for * 3600,
+            window=window * 60,
+            concurrency=args.concurrency,
+            max_age=args.max_age * 3600,
+        )
+        n_unpinned = len(unpinned["athletes"]) + len(unpinned["events"])
+        logger.info(
+            "Warmed %d of %d - %d without this week's results",
+            n_warmed, n_warmed + len(failures) + n_unpinned, n_unpinned,
+        )
+
+        if args.now:
+            return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())